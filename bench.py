@@ -0,0 +1,430 @@
+"""Offline benchmarks for the storage and command hot paths of main.py
+
+Generates synthetic player data, then drives the command coroutines through a
+fake context (no Discord connection) and reports throughput, p50/p99 latency,
+peak RSS and file size for each scenario. Every scenario runs in a fresh
+process against the same generated data, so peak RSS is per scenario.
+
+    python bench.py                                   # 1k and 10k players, all backends
+    python bench.py --players 1000,100000,500000 --backends sqlite --output after.json
+    python bench.py --compare before.json             # print changes against an earlier run
+
+The JSON report goes to --output (or stdout); the summary table goes to stderr.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ===== CONFIGURATION =====
+
+BACKENDS = ("json", "sqlite", "journal")
+SCENARIOS = ("generate", "load", "get_player", "new_player", "draw", "x", "add", "save")
+
+# Synthetic ids are snowflake-sized so keys look like real ones
+BASE_USER_ID = 100000000000000000
+
+# Players are written to storage in batches of this many while generating
+GENERATE_BATCH = 20000
+
+# Distinct card texts the synthetic decks draw from (every 4th has no MP cost)
+CARD_POOL = 5000
+
+# (distinct entries, weight) of a custom deck; most decks are small, a few are large
+DECK_SIZE_WEIGHTS = ((0, 20), (5, 25), (12, 25), (40, 20), (150, 8), (400, 2))
+
+# Players whose dirty decks go into each timed flush of the save scenario
+SAVE_BATCH = 100
+
+# ===== SYNTHETIC DATA =====
+
+def card_text(card_num):
+    if card_num % 4 == 3:
+        return f"Card {card_num}"
+    return f"Card {card_num} - {card_num % 9 + 1} Mp"
+
+def synthetic_player(main, rng):
+    """A resident player record with 0-5 customised decks of varied size"""
+    player = main.create_default_player()
+    sizes, weights = zip(*DECK_SIZE_WEIGHTS)
+    for deck_num in main.DECK_SLOTS:
+        # Most players leave some slots on the template (not stored at all)
+        if rng.random() < 0.4:
+            continue
+        deck = main.create_default_deck(deck_num)
+        entries = rng.choices(sizes, weights)[0]
+        cards = rng.sample(range(CARD_POOL), entries)
+        deck["cards"] = main.card_ids([card_text(card_num) for card_num in cards])
+        deck["counts"] = main.array('I', (rng.choice((1, 1, 1, 2, 3, 4)) for _ in cards))
+        deck["name"] = f"Deck {deck_num} ({entries})"
+        deck["max_mp"] = deck["current_mp"] = rng.randint(5, 20)
+        deck["hand_size"] = rng.choice((4, 5, 6, 6, 6, 7))
+        player["decks"][deck_num] = deck
+    playable = [deck_num for deck_num, deck in player["decks"].items() if main.deck_size(deck) >= deck["hand_size"]]
+    player["current_deck"] = rng.choice(playable) if playable else "1"
+    return player
+
+def generation_store(main):
+    """Storage to write generated players through: the journal backend starts from a plain snapshot"""
+    if main.STORAGE_BACKEND == "journal":
+        return main.JsonStorage(main.DATA_FILE)
+    return main.open_storage()
+
+def data_files(main):
+    if main.STORAGE_BACKEND == "sqlite":
+        return [main.DATABASE_FILE, main.DATABASE_FILE + "-wal"]
+    return [main.DATA_FILE, main.JOURNAL_FILE]
+
+def file_bytes(main):
+    return sum(os.path.getsize(path) for path in data_files(main) if os.path.exists(path))
+
+# ===== FAKE CONTEXT =====
+
+class FakePermissions:
+    administrator = False
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.display_name = f"Player {user_id % 100000}"
+        self.mention = f"<@{user_id}>"
+        self.bot = False
+        self.guild_permissions = FakePermissions()
+
+class FakeContext:
+    """Just enough of commands.Context for the command bodies; replies are counted, not sent"""
+    
+    def __init__(self, user_id):
+        self.author = FakeUser(user_id)
+        self.guild = None
+        self.command = None
+        self.interaction = None
+        self.channel = types.SimpleNamespace(id=1)
+        self.message = types.SimpleNamespace(mentions=[], role_mentions=[], attachments=[])
+        self.replies = 0
+    
+    async def send(self, content=None, **kwargs):
+        self.replies += 1
+        return types.SimpleNamespace(id=self.replies, edit=None)
+
+async def run_command(main, command, user_id, *args, **kwargs):
+    """Run a command body the way the bot does: under the player's lock"""
+    ctx = FakeContext(user_id)
+    async with main.player_locks.hold(user_id):
+        await command.callback(ctx, *args, **kwargs)
+
+# ===== SCENARIOS =====
+
+class Timer:
+    """Collects one duration per operation"""
+    
+    def __init__(self):
+        self.durations = []
+    
+    @contextlib.contextmanager
+    def op(self):
+        started = time.perf_counter()
+        yield
+        self.durations.append(time.perf_counter() - started)
+
+def existing_ids(rng, players, count):
+    return [BASE_USER_ID + i for i in rng.sample(range(players), min(count, players))]
+
+async def scenario_generate(main, spec, rng, timer):
+    """Build the synthetic players and write them to storage in batches"""
+    store = generation_store(main)
+    store.open()
+    for start in range(0, spec["players"], GENERATE_BATCH):
+        batch = {
+            str(BASE_USER_ID + i): synthetic_player(main, rng)
+            for i in range(start, min(start + GENERATE_BATCH, spec["players"]))
+        }
+        with timer.op():
+            store.write(store.snapshot(batch, dict.fromkeys(batch)))
+    store.close()
+    return {
+        "op": f"write of up to {GENERATE_BATCH} players",
+        "players_per_sec": round(spec["players"] / sum(timer.durations), 1),
+        "cards": len(main.card_catalog),
+    }
+
+async def scenario_load(main, spec, rng, timer):
+    """Open storage (index / catalog load) as load_data does at startup"""
+    with timer.op():
+        main.load_data()
+    return {"op": "load_data()"}
+
+async def scenario_get_player(main, spec, rng, timer):
+    main.load_data()
+    for user_id in existing_ids(rng, spec["players"], spec["ops"]):
+        with timer.op():
+            main.get_player(user_id)
+    return {"op": "cold get_player"}
+
+async def scenario_new_player(main, spec, rng, timer):
+    main.load_data()
+    for i in range(spec["ops"]):
+        with timer.op():
+            main.get_player(BASE_USER_ID + spec["players"] + i)
+    return {"op": "get_player for a new player"}
+
+async def scenario_draw(main, spec, rng, timer):
+    main.load_data()
+    user_ids = existing_ids(rng, spec["players"], spec["ops"])
+    for i in range(spec["ops"]):
+        with timer.op():
+            await run_command(main, main.draw, user_ids[i % len(user_ids)])
+    return {"op": "$draw"}
+
+async def scenario_x(main, spec, rng, timer):
+    main.load_data()
+    user_ids = existing_ids(rng, spec["players"], spec["ops"])
+    for user_id in user_ids:
+        await run_command(main, main.draw, user_id)
+    for i in range(spec["ops"]):
+        with timer.op():
+            await run_command(main, main.x, user_ids[i % len(user_ids)], "1", "3", "5")
+    return {"op": "$x 1 3 5"}
+
+async def scenario_add(main, spec, rng, timer):
+    main.load_data()
+    user_ids = existing_ids(rng, spec["players"], spec["ops"])
+    for i in range(spec["ops"]):
+        cards = "\n".join(f"{rng.randint(1, 3)}x {card_text(rng.randrange(CARD_POOL))}" for _ in range(3))
+        with timer.op():
+            await run_command(main, main.add, user_ids[i % len(user_ids)], text=cards)
+    return {"op": "$add of 3 lines"}
+
+async def scenario_save(main, spec, rng, timer):
+    """Flush rounds of SAVE_BATCH players changed by $add, as the write-behind worker would"""
+    main.load_data()
+    main._flush_lock = asyncio.Lock()
+    before = file_bytes(main)
+    written = main.metrics.flush_bytes
+    user_ids = existing_ids(rng, spec["players"], spec["ops"])
+    for start in range(0, len(user_ids), SAVE_BATCH):
+        for user_id in user_ids[start:start + SAVE_BATCH]:
+            await run_command(main, main.add, user_id, text=card_text(rng.randrange(CARD_POOL)))
+        with timer.op():
+            await main.flush_data()
+    return {
+        "op": f"flush of {SAVE_BATCH} changed players",
+        "bytes_written": main.metrics.flush_bytes - written,
+        "file_growth_bytes": file_bytes(main) - before,
+    }
+
+SCENARIO_FUNCTIONS = {
+    "generate": scenario_generate,
+    "load": scenario_load,
+    "get_player": scenario_get_player,
+    "new_player": scenario_new_player,
+    "draw": scenario_draw,
+    "x": scenario_x,
+    "add": scenario_add,
+    "save": scenario_save,
+}
+
+# ===== WORKER =====
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of a sorted list"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))]
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+def run_worker(spec):
+    """Run one scenario in this (fresh) process and return its result row"""
+    # main reads its configuration at import time
+    os.environ.update(spec["env"])
+    sys.path.insert(0, REPO_DIR)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        import main
+        # The JSON data file path is fixed in main, not read from the environment
+        main.DATA_FILE = spec["env"]["DATA_FILE"]
+        rng = random.Random(f"{spec['seed']}:{spec['scenario']}")
+        main.random.seed(spec["seed"])
+        timer = Timer()
+        started = time.perf_counter()
+        extra = asyncio.run(SCENARIO_FUNCTIONS[spec["scenario"]](main, spec, rng, timer))
+        elapsed = time.perf_counter() - started
+        if main.storage is not None:
+            main.storage.close()
+    
+    ordered = sorted(timer.durations)
+    measured = sum(ordered)
+    return {
+        "backend": spec["backend"],
+        "players": spec["players"],
+        "scenario": spec["scenario"],
+        **extra,
+        "ops": len(ordered),
+        "seconds": round(measured, 6),
+        "wall_seconds": round(elapsed, 6),
+        "ops_per_sec": round(len(ordered) / measured, 1) if measured else None,
+        "mean_ms": round(1000 * measured / len(ordered), 4) if ordered else None,
+        "p50_ms": round(1000 * percentile(ordered, 0.50), 4),
+        "p99_ms": round(1000 * percentile(ordered, 0.99), 4),
+        "max_ms": round(1000 * ordered[-1], 4) if ordered else None,
+        "peak_rss_kb": peak_rss_kb(),
+        "file_bytes": file_bytes(main),
+    }
+
+# ===== DRIVER =====
+
+def scenario_env(workdir, backend):
+    return {
+        "STORAGE_BACKEND": backend,
+        "DATA_FILE": os.path.join(workdir, "player_data.json"),
+        "DATABASE_FILE": os.path.join(workdir, "player_data.db"),
+        "JOURNAL_FILE": os.path.join(workdir, "player_data.journal"),
+        "SESSION_FILE": os.path.join(workdir, "session_state.json"),
+        "SYNC_SLASH_COMMANDS": "0",
+        "METRICS_PORT": "0",
+    }
+
+def run_scenario(spec):
+    """Run a scenario in a child process and read back its result row"""
+    fd, result_path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    try:
+        command = [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(spec), "--result", result_path]
+        # Run inside the data directory so nothing lands next to main.py
+        completed = subprocess.run(command, capture_output=True, text=True, cwd=os.path.dirname(spec["env"]["DATA_FILE"]))
+        if completed.returncode != 0:
+            raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else f"exit {completed.returncode}")
+        with open(result_path) as f:
+            return json.load(f)
+    finally:
+        os.remove(result_path)
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def format_row(row):
+    rss = f"{row['peak_rss_kb'] / 1024:.0f} MB" if row["peak_rss_kb"] else "-"
+    return (
+        f"{row['backend']:<8} {row['players']:>7} {row['scenario']:<11} {row['ops']:>6} ops "
+        f"{row['ops_per_sec'] or 0:>11.1f}/s  p50 {row['p50_ms']:>9.3f} ms  p99 {row['p99_ms']:>9.3f} ms  "
+        f"rss {rss:>7}  file {row['file_bytes'] / 1024 / 1024:>8.1f} MB"
+    )
+
+def compare(results, baseline):
+    """Print throughput and latency changes against an earlier report"""
+    previous = {(row["backend"], row["players"], row["scenario"]): row for row in baseline["results"]}
+    print(f"\n📊 Compared with {baseline.get('revision') or 'baseline'} ({baseline.get('started')})", file=sys.stderr)
+    for row in results:
+        old = previous.get((row["backend"], row["players"], row["scenario"]))
+        if old is None or not old.get("ops_per_sec") or not row.get("ops_per_sec"):
+            continue
+        changes = [f"{row['ops_per_sec'] / old['ops_per_sec']:.2f}x throughput"]
+        for key in ("p50_ms", "p99_ms"):
+            if old[key]:
+                changes.append(f"{key[:3]} {100 * (row[key] - old[key]) / old[key]:+.0f}%")
+        if old.get("peak_rss_kb") and row.get("peak_rss_kb"):
+            changes.append(f"rss {100 * (row['peak_rss_kb'] - old['peak_rss_kb']) / old['peak_rss_kb']:+.0f}%")
+        print(f"{row['backend']:<8} {row['players']:>7} {row['scenario']:<11} " + ", ".join(changes), file=sys.stderr)
+
+def parse_list(text, cast=str):
+    return [cast(item.strip()) for item in text.split(",") if item.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Mythos Bot storage and command hot paths offline")
+    parser.add_argument("--players", default="1000,10000", help="comma-separated player counts (default 1000,10000)")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="comma-separated storage backends")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated scenarios (generate always runs)")
+    parser.add_argument("--ops", type=int, default=2000, help="operations per scenario (default 2000)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    parser.add_argument("--workdir", help="directory for generated data (kept); a temporary one is removed otherwise")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.worker:
+        row = run_worker(json.loads(args.worker))
+        with open(args.result, 'w') as f:
+            json.dump(row, f)
+        return
+    
+    backends = parse_list(args.backends)
+    scenarios = [scenario for scenario in parse_list(args.scenarios) if scenario != "generate"]
+    for name in backends + scenarios:
+        if name not in BACKENDS + SCENARIOS:
+            parser.error(f"unknown backend or scenario: {name}")
+    
+    report = {
+        "revision": git_revision(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"ops": args.ops, "seed": args.seed, "generate_batch": GENERATE_BATCH, "save_batch": SAVE_BATCH},
+        "results": [],
+    }
+    root = args.workdir or tempfile.mkdtemp(prefix="mythos-bench-")
+    try:
+        for backend in backends:
+            for players in parse_list(args.players, int):
+                workdir = os.path.join(root, f"{backend}-{players}")
+                shutil.rmtree(workdir, ignore_errors=True)
+                os.makedirs(workdir)
+                # The save scenario writes to the data, so it runs last
+                for scenario in ["generate"] + scenarios:
+                    spec = {
+                        "backend": backend, "players": players, "scenario": scenario,
+                        "ops": args.ops, "seed": args.seed, "env": scenario_env(workdir, backend),
+                    }
+                    try:
+                        row = run_scenario(spec)
+                    except RuntimeError as e:
+                        print(f"❌ {backend} {players} {scenario}: {e}", file=sys.stderr)
+                        continue
+                    report["results"].append(row)
+                    print(format_row(row), file=sys.stderr)
+                if not args.workdir:
+                    shutil.rmtree(workdir, ignore_errors=True)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(root, ignore_errors=True)
+    
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report["results"], json.load(f))
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report saved to {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
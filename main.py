@@ -1,136 +1,2396 @@
 import os
 import random
 import discord
+from discord import app_commands
 from discord.ext import commands
-from typing import Optional
+from aiohttp import web
+from typing import Optional, Union
 import json
+import math
+import multiprocessing
+import operator
 import traceback
+import asyncio
+import contextlib
+import contextvars
+import csv
+import io
+import itertools
+import re
+import signal
+import sqlite3
+import sys
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from types import MappingProxyType
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # listed in requirements.txt; without it $odds falls back to a smaller pure-Python simulation
+    np = None
 
 # Bot setup
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix='$', intents=intents)
+# Role-wide admin commands ($draw @Party) need the privileged Server Members
+# intent to see every member of a role; enable it in the developer portal first
+intents.members = os.environ.get("MEMBERS_INTENT", "0") == "1"
+
+# Base deck
+BASE_DECK = [
+    "Fire - 3 Mp",
+    "Wind - 3 Mp", 
+    "Water - 3 Mp",
+    "Earth - 3 Mp",
+    "Ball - 2 Mp",
+    "Bolt - 2 Mp",
+    "Wall - 3 Mp",
+    "Burst - 3 Mp",
+    "Forward - 1 Mp",
+    "Down - 1 Mp",
+    "Orbit - 2 Mp",
+    "Split - 2 Mp"
+]
+
+# Cards follow the "Name - N Mp" convention of the base deck
+COST_PATTERN = re.compile(r"^(.*?)\s*-\s*(\d+)\s*mp$", re.IGNORECASE)
+
+def parse_card(text):
+    """Split "Name - N Mp" into (name, MP cost); the cost is None for cards without one"""
+    match = COST_PATTERN.match(text.strip())
+    if match:
+        return match.group(1), int(match.group(2))
+    return text, None
+
+class CardCatalog:
+    """Interns each distinct card text once; decks and hands store the integer ids"""
+    
+    def __init__(self):
+        self.texts = []  # card id -> text; ids are never reused
+        self.ids = {}    # text -> card id
+        self.parsed = []  # card id -> (name, MP cost), parsed lazily and dropped when the text changes
+    
+    def __len__(self):
+        return len(self.texts)
+    
+    def intern(self, text):
+        """Get the id for a card text, adding it to the catalog if new"""
+        card_id = self.ids.get(text)
+        if card_id is None:
+            card_id = self.ids[text] = len(self.texts)
+            self.texts.append(text)
+        return card_id
+    
+    def text(self, card_id):
+        return self.texts[card_id]
+    
+    def info(self, card_id):
+        """(name, MP cost) of a card, parsing any entries not seen yet"""
+        parsed = self.parsed
+        while len(parsed) <= card_id:
+            parsed.append(parse_card(self.texts[len(parsed)] or ""))
+        return parsed[card_id]
+    
+    def cost(self, card_id):
+        return self.info(card_id)[1]
+    
+    def ensure(self, card_id, text):
+        """Restore a persisted entry, keeping its original id"""
+        while len(self.texts) <= card_id:
+            self.texts.append(None)
+        self.texts[card_id] = text
+        self.ids[text] = card_id
+        del self.parsed[card_id:]
+    
+    def load(self, texts):
+        """Replace the catalog with a persisted one (ids are list positions)"""
+        self.texts = list(texts)
+        self.ids = {text: card_id for card_id, text in enumerate(self.texts)}
+        self.parsed = []
+
+card_catalog = CardCatalog()
+
+def card_ids(cards):
+    """Intern card texts into a compact id array (ids pass through unchanged)"""
+    return array('I', (card_catalog.intern(c) if isinstance(c, str) else c for c in cards))
+
+def known_card_ids(cards):
+    """Like card_ids, but only looks texts up (KeyError if new), so it is safe off the event loop"""
+    return array('I', (card_catalog.ids[c] if isinstance(c, str) else c for c in cards))
+
+def card_texts(ids):
+    """Resolve card ids to their text for rendering"""
+    return [card_catalog.texts[card_id] for card_id in ids]
+
+# File for data persistence
+DATA_FILE = "player_data.json"
+DATABASE_FILE = os.environ.get("DATABASE_FILE", "player_data.db")
+
+# "json" rewrites one file (fine for small installs), "sqlite" stores one row per
+# player/deck, "journal" appends operations and periodically compacts into DATA_FILE
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "json").lower()
+JOURNAL_FILE = os.environ.get("JOURNAL_FILE", "player_data.journal")
+JOURNAL_COMPACT_BYTES = int(os.environ.get("JOURNAL_COMPACT_BYTES", str(4 * 1024 * 1024)))
+
+# Every server keeps its own decks: players are stored under "guild id:user id".
+# A player's record from before this (bare user id) is copied into a server on first use
+GUILD_NAMESPACES = os.environ.get("GUILD_NAMESPACES", "1") == "1"
+
+# SHARDED=1 runs an AutoShardedBot. SHARD_COUNT and SHARD_IDS (e.g. "0,1") split the
+# shards over several processes, each loading and flushing only its own servers' players;
+# those processes should share the sqlite backend
+SHARDED = os.environ.get("SHARDED", "0") == "1"
+SHARD_COUNT = int(os.environ["SHARD_COUNT"]) if os.environ.get("SHARD_COUNT") else None
+SHARD_IDS = [int(shard_id) for shard_id in os.environ.get("SHARD_IDS", "").split(",") if shard_id.strip()] or None
+
+# Write-behind tuning: flush once mutations have been quiet for FLUSH_INTERVAL
+# seconds, but never keep a dirty player unsaved for more than FLUSH_MAX_DELAY
+FLUSH_INTERVAL = float(os.environ.get("FLUSH_INTERVAL", "2"))
+FLUSH_MAX_DELAY = float(os.environ.get("FLUSH_MAX_DELAY", "10"))
+
+# Play state (hands, discard piles, current MP) changes on almost every command,
+# so it stays in memory and is checkpointed to SESSION_FILE every
+# SESSION_CHECKPOINT_INTERVAL seconds and on shutdown instead of going through storage
+SESSION_FILE = os.environ.get("SESSION_FILE", "session_state.json")
+if SHARD_IDS:
+    # One checkpoint per process, since each only holds its own shards' players
+    SESSION_FILE = "{0}.shards-{2}{1}".format(*os.path.splitext(SESSION_FILE), "-".join(map(str, SHARD_IDS)))
+SESSION_CHECKPOINT_INTERVAL = float(os.environ.get("SESSION_CHECKPOINT_INTERVAL", "30"))
+
+# Players are loaded on demand and kept in an LRU bounded by both limits
+CACHE_MAX_PLAYERS = int(os.environ.get("CACHE_MAX_PLAYERS", "5000"))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Rendered hands, deck lists and deck overviews, reused until the deck changes
+RENDER_CACHE_SIZE = int(os.environ.get("RENDER_CACHE_SIZE", "2000"))
+
+# Decks longer than one page are shown in a single message with page buttons
+# that stop responding after PAGE_VIEW_TIMEOUT seconds
+PAGE_VIEW_TIMEOUT = float(os.environ.get("PAGE_VIEW_TIMEOUT", "180"))
+
+# The hand posted by $draw carries replace/MP buttons for HAND_VIEW_TIMEOUT seconds
+HAND_VIEW_TIMEOUT = float(os.environ.get("HAND_VIEW_TIMEOUT", "600"))
+
+# Outgoing command replies are paced per channel to stay inside Discord's
+# per-channel bucket (CHANNEL_BURST messages per CHANNEL_BURST_WINDOW seconds)
+CHANNEL_BURST = int(os.environ.get("CHANNEL_BURST", "5"))
+CHANNEL_BURST_WINDOW = float(os.environ.get("CHANNEL_BURST_WINDOW", "5"))
+
+# Register the slash commands with Discord on startup
+SYNC_SLASH_COMMANDS = os.environ.get("SYNC_SLASH_COMMANDS", "1") == "1"
+
+# Largest deck file $import accepts
+IMPORT_MAX_BYTES = int(os.environ.get("IMPORT_MAX_BYTES", str(1024 * 1024)))
+
+# $odds simulations: hands per query (fewer without NumPy), worker processes, cached results
+ODDS_TRIALS = int(os.environ.get("ODDS_TRIALS", "200000"))
+ODDS_FALLBACK_TRIALS = int(os.environ.get("ODDS_FALLBACK_TRIALS", "20000"))
+ODDS_WORKERS = int(os.environ.get("ODDS_WORKERS", "2"))
+ODDS_CACHE_SIZE = int(os.environ.get("ODDS_CACHE_SIZE", "500"))
+
+# Members looked up through the API (not in the guild cache) are remembered this long
+MEMBER_FETCH_TTL = float(os.environ.get("MEMBER_FETCH_TTL", "300"))
+
+# Commands touching the same player are serialized on one of a fixed pool of locks
+PLAYER_LOCK_STRIPES = int(os.environ.get("PLAYER_LOCK_STRIPES", "256"))
+
+# Prometheus text endpoint (GET /metrics); off unless METRICS_PORT is set.
+# Binds to localhost by default so metrics aren't exposed publicly by accident
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+
+# How often the event loop lag probe runs (seconds)
+LOOP_LAG_INTERVAL = float(os.environ.get("LOOP_LAG_INTERVAL", "1"))
+
+# Write-behind state: user id -> set of dirty deck numbers, or None for the whole player
+dirty_players = {}
+_first_dirty_at = None
+_last_dirty_at = None
+_flush_event = None
+_flush_lock = None
+_storage_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage")
+
+# Players whose latest state may not be in storage yet (evicted while dirty, or
+# part of a flush that is still being written); get_player checks here before storage
+_unsaved_players = {}
+
+# Session tier: user id -> {deck num: play state} as of the last checkpoint or
+# eviction, and the players whose resident play state has changed since
+SESSION_FIELDS = ("hand", "discard", "current_mp")
+session_store = {}
+session_dirty = set()
+
+def _json_default(obj):
+    if isinstance(obj, array):
+        return obj.tolist()
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+def to_json(obj):
+    """Compact JSON used for everything written to storage"""
+    return json.dumps(obj, separators=(",", ":"), default=_json_default)
+
+def serialize_player(player):
+    """Serialize a single player record, leaving out decks still equal to their template"""
+    return to_json(compact_player(player))
+
+def approx_player_size(player):
+    """Rough resident size of a player record in bytes, for cache accounting"""
+    size = 500
+    for deck in player["decks"].values():
+        size += 500 + len(deck["name"]) + len(deck["stats"])
+        size += 4 * (2 * len(deck["cards"]) + len(deck["hand"]) + len(deck["discard"]))
+    return size
+
+class PlayerCache:
+    """LRU of resident player records, bounded by count and approximate bytes"""
+    
+    def __init__(self, max_players, max_bytes):
+        self.max_players = max_players
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # user id -> (player, approximate size)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def get(self, user_id):
+        """Look up a player, counting the hit or miss and refreshing its recency"""
+        entry = self.entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(user_id)
+        return entry[0]
+    
+    def peek(self, user_id):
+        """Look up a player without touching counters or recency"""
+        entry = self.entries.get(user_id)
+        return entry[0] if entry else None
+    
+    def put(self, user_id, player):
+        """Insert or resize a player, returning the (user id, player) pairs evicted to make room"""
+        old = self.entries.pop(user_id, None)
+        if old:
+            self.total_bytes -= old[1]
+        size = approx_player_size(player)
+        self.entries[user_id] = (player, size)
+        self.total_bytes += size
+        return self._evict()
+    
+    def resize(self, user_id):
+        """Re-estimate a resident player's size after a change, returning the players evicted to make room"""
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return []
+        size = approx_player_size(entry[0])
+        self.entries[user_id] = (entry[0], size)
+        self.total_bytes += size - entry[1]
+        return self._evict()
+    
+    def _evict(self):
+        # The most recently used player always stays, however large
+        evicted = []
+        while len(self.entries) > 1 and (len(self.entries) > self.max_players or self.total_bytes > self.max_bytes):
+            evicted_id, (evicted_player, evicted_size) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+            self.evictions += 1
+            evicted.append((evicted_id, evicted_player))
+        return evicted
+
+player_cache = PlayerCache(CACHE_MAX_PLAYERS, CACHE_MAX_BYTES)
+
+class RenderCache:
+    """LRU of rendered messages, each stamped with the deck version it was rendered from"""
+    
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # (user id, deck num, view) -> (version, rendered)
+        self.hits = 0
+        self.misses = 0
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def get(self, key, version):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[1]
+    
+    def put(self, key, version, rendered):
+        self.entries[key] = (version, rendered)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+render_cache = RenderCache(RENDER_CACHE_SIZE)
+
+# (user id, deck num) -> version; deck num None covers the player as a whole.
+# Invalidating drops the entry and the next lookup hands out a never-used
+# number, so versions can be forgotten for evicted players without going stale
+deck_versions = {}
+_version_counter = itertools.count(1)
+
+class JsonStorage:
+    """Single JSON file with one player per line, read lazily through an offset index"""
+    
+    META_KEY = "__meta__"  # never a Discord id, so it can't collide with a player
+    
+    def __init__(self, path):
+        self.path = path
+        self.meta = {}
+        self.index = {}  # user id -> (offset, length) of the player's JSON in the file
+        self._file = None
+        self._lock = threading.Lock()
+    
+    def open(self):
+        """Index the data file without parsing any player records"""
+        if not os.path.exists(self.path):
+            print("📁 No existing data file found, starting fresh")
+            return
+        if self._swap(*self._build_index()):
+            card_catalog.load(self.meta.get("catalog", []))
+        else:
+            # Pretty-printed file from older versions: parse once and rewrite line-per-player
+            print("🔄 Converting data file to one player per line")
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.meta = data.pop(self.META_KEY, {})
+            self.write(({user_id: to_json(p) for user_id, p in data.items()}, len(card_catalog)))
+        print(f"✅ Indexed {len(self.index)} players in {self.path}")
+    
+    def _build_index(self):
+        """Scan line offsets and keys; returns (index, meta, file) or Nones for a legacy file"""
+        f = open(self.path, 'rb')
+        if f.readline().strip() != b"{":
+            f.close()
+            return None, None, None
+        index, meta = {}, {}
+        offset = f.tell()
+        for line in f:
+            body = line.rstrip(b"\r\n").rstrip(b",")
+            sep = body.find(b'":')
+            if body == b"}":
+                break
+            if body and (not body.startswith(b'"') or sep < 0):
+                f.close()
+                return None, None, None
+            if body:
+                key = json.loads(body[:sep + 1])
+                if key == self.META_KEY:
+                    meta = json.loads(body[sep + 2:])
+                else:
+                    index[key] = (offset + sep + 2, len(body) - sep - 2)
+            offset += len(line)
+        return index, meta, f
+    
+    def _swap(self, index, meta, f):
+        """Point readers at a freshly written or indexed file"""
+        if f is None:
+            return False
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self.index, self.meta, self._file = index, meta, f
+        return True
+    
+    def load_player(self, user_id):
+        with self._lock:
+            entry = self.index.get(user_id)
+            if entry is None:
+                return None
+            self._file.seek(entry[0])
+            blob = self._file.read(entry[1])
+        return json.loads(blob)
+    
+    def iter_players(self):
+        """Yield every stored (user id, player); used by migration and maintenance"""
+        for user_id in list(self.index):
+            player = self.load_player(user_id)
+            if player is not None:
+                yield user_id, player
+    
+    def record(self, user_id, deck_num, op, args):
+        pass
+    
+    def snapshot(self, players, batch):
+        """Serialize the changed players (event loop) and return the write payload"""
+        changes = {user_id: serialize_player(p) if p is not None else None for user_id, p in players.items()}
+        return changes, len(card_catalog)
+    
+    def _write_file(self, changes, catalog_size):
+        """Write a new data file merging changed blobs with untouched ones copied from the old file"""
+        # The catalog is append-only, so a prefix read from this thread is consistent
+        self.meta["catalog"] = card_catalog.texts[:catalog_size]
+        tmp_file = self.path + ".tmp"
+        new_index = {}
+        old = open(self.path, 'rb') if self._file is not None else None
+        try:
+            with open(tmp_file, 'wb') as out:
+                out.write(b"{")
+                
+                def emit(user_id, blob):
+                    prefix = (b"\n" if out.tell() == 1 else b",\n") + json.dumps(user_id).encode() + b":"
+                    out.write(prefix)
+                    new_index[user_id] = (out.tell(), len(blob))
+                    out.write(blob)
+                
+                if self.meta:
+                    emit(self.META_KEY, to_json(self.meta).encode())
+                for user_id, (offset, length) in self.index.items():
+                    if user_id in changes:
+                        continue
+                    old.seek(offset)
+                    emit(user_id, old.read(length))
+                for user_id, blob in changes.items():
+                    if blob is not None:
+                        emit(user_id, blob.encode())
+                out.write(b"\n}\n")
+                out.flush()
+                os.fsync(out.fileno())
+        finally:
+            if old is not None:
+                old.close()
+        os.replace(tmp_file, self.path)
+        new_index.pop(self.META_KEY, None)
+        return new_index, dict(self.meta), open(self.path, 'rb')
+    
+    def write(self, payload):
+        """Atomically replace the data file (storage thread); returns the bytes written"""
+        self._swap(*self._write_file(*payload))
+        return os.path.getsize(self.path)
+    
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+class SqliteStorage:
+    """SQLite storage with one row per player and per deck"""
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS players (
+            user_id TEXT PRIMARY KEY,
+            current_deck TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS decks (
+            user_id TEXT NOT NULL,
+            deck_num TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (user_id, deck_num)
+        );
+        CREATE TABLE IF NOT EXISTS cards (
+            card_id INTEGER PRIMARY KEY,
+            text TEXT NOT NULL
+        );
+    """
+    SELECT_PLAYER = "SELECT current_deck FROM players WHERE user_id = ?"
+    SELECT_DECKS = "SELECT deck_num, data FROM decks WHERE user_id = ?"
+    UPSERT_PLAYER = "INSERT OR REPLACE INTO players (user_id, current_deck) VALUES (?, ?)"
+    UPSERT_DECK = "INSERT OR REPLACE INTO decks (user_id, deck_num, data) VALUES (?, ?, ?)"
+    DELETE_PLAYER = "DELETE FROM players WHERE user_id = ?"
+    DELETE_DECKS = "DELETE FROM decks WHERE user_id = ?"
+    DELETE_DECK = "DELETE FROM decks WHERE user_id = ? AND deck_num = ?"
+    INSERT_CARD = "INSERT OR IGNORE INTO cards (card_id, text) VALUES (?, ?)"
+    
+    def __init__(self, path):
+        self.path = path
+        # Writes only ever happen on the single storage thread; reads get their own
+        # connection so WAL lets them proceed while a flush is committing
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self.reader = sqlite3.connect(path, check_same_thread=False)
+        self.catalog_saved = 0
+    
+    def open(self):
+        card_catalog.load(text for _, text in self.reader.execute("SELECT card_id, text FROM cards ORDER BY card_id"))
+        self.catalog_saved = len(card_catalog)
+        count = self.reader.execute("SELECT COUNT(*) FROM players").fetchone()[0]
+        print(f"✅ {count} players in {self.path}")
+    
+    def load_player(self, user_id):
+        row = self.reader.execute(self.SELECT_PLAYER, (user_id,)).fetchone()
+        if row is None:
+            return None
+        decks = {deck_num: json.loads(blob) for deck_num, blob in self.reader.execute(self.SELECT_DECKS, (user_id,))}
+        return {"current_deck": row[0], "decks": decks}
+    
+    def iter_players(self):
+        for (user_id,) in self.reader.execute("SELECT user_id FROM players").fetchall():
+            yield user_id, self.load_player(user_id)
+    
+    def record(self, user_id, deck_num, op, args):
+        pass
+    
+    def snapshot(self, players, batch):
+        """Serialize only the dirty decks (event loop) and return the write payload"""
+        player_rows, deck_rows, deck_deletes, cleared = [], [], [], []
+        for user_id, deck_nums in batch.items():
+            player = players.get(user_id)
+            if player is None:
+                cleared.append((user_id,))
+                continue
+            if deck_nums is None:
+                # Whole player: drop every deck row and write back the customized ones
+                player_rows.append((user_id, player["current_deck"]))
+                cleared.append((user_id,))
+                deck_nums = player["decks"].keys()
+            for deck_num in deck_nums:
+                deck = player["decks"].get(deck_num)
+                if deck is None or is_template_deck(deck, deck_num, SESSION_FIELDS):
+                    deck_deletes.append((user_id, deck_num))
+                else:
+                    deck_rows.append((user_id, deck_num, to_json(durable_deck(deck))))
+        deleted = [row for row in cleared if players.get(row[0]) is None]
+        new_cards = [(card_id, card_catalog.texts[card_id]) for card_id in range(self.catalog_saved, len(card_catalog))]
+        return player_rows, deck_rows, deck_deletes, cleared, deleted, new_cards
+    
+    def write(self, payload):
+        """Apply the payload in a single transaction (storage thread); returns the bytes of row data"""
+        player_rows, deck_rows, deck_deletes, cleared, deleted, new_cards = payload
+        with self.conn:
+            self.conn.executemany(self.INSERT_CARD, new_cards)
+            self.conn.executemany(self.DELETE_DECKS, cleared)
+            self.conn.executemany(self.DELETE_PLAYER, deleted)
+            self.conn.executemany(self.DELETE_DECK, deck_deletes)
+            self.conn.executemany(self.UPSERT_PLAYER, player_rows)
+            self.conn.executemany(self.UPSERT_DECK, deck_rows)
+        if new_cards:
+            self.catalog_saved = max(self.catalog_saved, new_cards[-1][0] + 1)
+        return sum(len(row[2]) for row in deck_rows) + sum(len(row[1]) for row in new_cards)
+    
+    def close(self):
+        self.reader.close()
+        self.conn.close()
+
+class JournalStorage:
+    """Snapshot file plus an append-only journal of operations"""
+    
+    def __init__(self, snapshot_path, journal_path, compact_bytes):
+        self.snapshot_store = JsonStorage(snapshot_path)
+        self.journal_path = journal_path
+        self.compact_bytes = compact_bytes
+        self.seq = 0
+        self.written_seq = 0
+        self.tail = {}  # user id -> serialized records not yet folded into the snapshot
+        self.catalog_logged = 0
+        self._tail_lock = threading.Lock()
+        self._pending = []  # records not yet appended; dropped only once a write succeeds
+        self._journal = None
+    
+    def open(self):
+        """Index the snapshot and read the journal tail, grouping records by player"""
+        self.snapshot_store.open()
+        self.seq = self.snapshot_store.meta.get("journal_seq", 0)
+        replayed = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn write from a crash; nothing after it was acknowledged
+                        break
+                    if "c" in record:
+                        # Catalog entry, logged ahead of the records that use it
+                        card_catalog.ensure(*record["c"])
+                        continue
+                    if record["s"] <= self.seq:
+                        continue
+                    self.tail.setdefault(record["u"], []).append(line.strip())
+                    self.seq = record["s"]
+                    replayed += 1
+        self.written_seq = self.seq
+        self.catalog_logged = len(card_catalog)
+        if replayed:
+            print(f"📜 {replayed} journal records pending replay")
+        self._journal = open(self.journal_path, 'a')
+    
+    def _load(self, user_id, max_seq=None, to_ids=card_ids):
+        """Snapshot state of a player with its journal tail (up to max_seq) applied.
+        Off the event loop pass to_ids=known_card_ids: only the loop may intern cards"""
+        player = self.snapshot_store.load_player(user_id)
+        if player is not None:
+            normalize_player(player, to_ids)
+        data = {user_id: player} if player is not None else {}
+        for line in self.tail.get(user_id, ()):
+            record = json.loads(line)
+            if max_seq is not None and record["s"] > max_seq:
+                break
+            replay_op(data, user_id, record["d"], record["o"], record["a"])
+        return data.get(user_id)
+    
+    def load_player(self, user_id):
+        with self._tail_lock:
+            return self._load(user_id)
+    
+    def iter_players(self):
+        """Yield every stored (user id, player); runs on the storage thread.
+        Players without journal records come back as stored, for the loop to normalize"""
+        with self._tail_lock:
+            user_ids = set(self.snapshot_store.index) | set(self.tail)
+        for user_id in user_ids:
+            with self._tail_lock:
+                if user_id in self.tail:
+                    # Loaded on the loop when the records were made, so its cards are all in the catalog
+                    player = self._load(user_id, to_ids=known_card_ids)
+                else:
+                    player = self.snapshot_store.load_player(user_id)
+            if player is not None:
+                yield user_id, player
+    
+    def record(self, user_id, deck_num, op, args):
+        """Queue one operation for the next journal append (event loop)"""
+        self.seq += 1
+        line = to_json({"s": self.seq, "u": user_id, "d": deck_num, "o": op, "a": list(args)})
+        with self._tail_lock:
+            self._pending.append(line)
+            self.tail.setdefault(user_id, []).append(line)
+    
+    def snapshot(self, players, batch):
+        # Nothing is consumed here: a failed write leaves the records and
+        # catalog entries in place for the next flush to retry
+        with self._tail_lock:
+            records = list(self._pending)
+        new_cards = [
+            to_json({"c": [card_id, card_catalog.texts[card_id]]})
+            for card_id in range(self.catalog_logged, len(card_catalog))
+        ]
+        return self.seq, new_cards, records, len(card_catalog)
+    
+    def write(self, payload):
+        """Append and fsync a batch of records, compacting once the journal is large (storage thread)"""
+        seq, new_cards, records, catalog_size = payload
+        written = 0
+        if new_cards or records:
+            batch = "\n".join(new_cards + records) + "\n"
+            start = self._journal.tell()
+            try:
+                self._journal.write(batch)
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+            except Exception:
+                # Cut off a partial append so the retry doesn't follow a torn line
+                self._journal.seek(start)
+                self._journal.truncate()
+                raise
+            self.written_seq = seq
+            written += len(batch)
+        with self._tail_lock:
+            del self._pending[:len(records)]
+        self.catalog_logged = catalog_size
+        if self._journal.tell() >= self.compact_bytes:
+            written += self.compact(catalog_size)
+        return written
+    
+    def compact(self, catalog_size):
+        """Fold the written journal into a fresh snapshot and truncate it; returns the snapshot size"""
+        seq = self.written_seq
+        with self._tail_lock:
+            user_ids = list(self.tail)
+        # Only players with journaled changes are parsed; everyone else is copied verbatim
+        changes = {}
+        for user_id in user_ids:
+            with self._tail_lock:
+                player = self._load(user_id, seq, known_card_ids)
+            if player is not None:
+                changes[user_id] = serialize_player(player)
+        store = self.snapshot_store
+        # The snapshot records the last folded seq, so a crash before the
+        # truncate below just skips those records on the next replay
+        store.meta["journal_seq"] = seq
+        new_file = store._write_file(changes, catalog_size)
+        with self._tail_lock:
+            store._swap(*new_file)
+            for user_id in user_ids:
+                remaining = [line for line in self.tail.get(user_id, ()) if json.loads(line)["s"] > seq]
+                if remaining:
+                    self.tail[user_id] = remaining
+                else:
+                    self.tail.pop(user_id, None)
+        self._journal.seek(0)
+        self._journal.truncate()
+        print(f"🗜️ Compacted journal for {len(changes)} player(s) into {store.path}")
+        return os.path.getsize(store.path)
+    
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+        self.snapshot_store.close()
+
+def open_storage():
+    """Create the storage backend selected by STORAGE_BACKEND"""
+    if STORAGE_BACKEND == "sqlite":
+        return SqliteStorage(DATABASE_FILE)
+    if STORAGE_BACKEND == "journal":
+        return JournalStorage(DATA_FILE, JOURNAL_FILE, JOURNAL_COMPACT_BYTES)
+    return JsonStorage(DATA_FILE)
+
+storage = None
+
+def load_data():
+    """Open storage; players are loaded lazily by get_player"""
+    global storage
+    try:
+        if storage is None:
+            storage = open_storage()
+        if SHARD_IDS and STORAGE_BACKEND != "sqlite":
+            print(f"⚠️ {STORAGE_BACKEND} storage is a single file; processes running other shards will overwrite each other's saves")
+        storage.open()
+        # Template card ids come from the catalog that was just loaded
+        build_deck_templates()
+        load_sessions()
+    except Exception as e:
+        print(f"❌ Error loading data: {e}")
+        traceback.print_exc()
+
+def migrate_json_to_sqlite(json_path=DATA_FILE, db_path=DATABASE_FILE):
+    """One-shot copy of an existing player_data.json into a SQLite database"""
+    source = JsonStorage(json_path)
+    source.open()
+    build_deck_templates()
+    target = SqliteStorage(db_path)
+    migrated = set()
+    try:
+        batch = {}
+        for user_id, player in source.iter_players():
+            # Same path as get_player: older files store card text and no counts
+            normalize_player(player)
+            batch[user_id] = player
+            if len(batch) >= 1000:
+                target.write(target.snapshot(batch, dict.fromkeys(batch)))
+                migrated.update(batch)
+                batch = {}
+        target.write(target.snapshot(batch, dict.fromkeys(batch)))
+        migrated.update(batch)
+        stored = sum(user_id in migrated for (user_id,) in target.reader.execute("SELECT user_id FROM players"))
+        if stored != len(migrated):
+            raise RuntimeError(f"only {stored} of {len(migrated)} migrated players are in {db_path}")
+    finally:
+        target.close()
+        source.close()
+    print(f"✅ Migrated {len(migrated)} players from {json_path} to {db_path}")
+
+def mark_dirty(user_id, deck_num=None):
+    """Queue a deck (or the whole player when deck_num is None) for the next background flush"""
+    global _first_dirty_at, _last_dirty_at
+    user_id = player_key(user_id)
+    now = time.monotonic()
+    if deck_num is None:
+        dirty_players[user_id] = None
+    else:
+        deck_nums = dirty_players.setdefault(user_id, set())
+        if deck_nums is not None:
+            deck_nums.add(deck_num)
+    if _first_dirty_at is None:
+        _first_dirty_at = now
+    _last_dirty_at = now
+    if _flush_event is not None:
+        _flush_event.set()
+
+async def flush_data():
+    """Write all dirty players to storage without blocking the event loop"""
+    global _first_dirty_at
+    async with _flush_lock:
+        if not dirty_players:
+            return
+        batch = dict(dirty_players)
+        dirty_players.clear()
+        _first_dirty_at = None
+        
+        players = {}
+        for user_id in batch:
+            players[user_id] = player_cache.peek(user_id) or _unsaved_players.get(user_id)
+        # Keep the batch reachable until it is on disk, in case it is evicted mid-write
+        _unsaved_players.update((user_id, p) for user_id, p in players.items() if p is not None)
+        
+        # Only what changed is re-serialized; this stays on the loop so no
+        # command can mutate a record while it is being dumped
+        started = time.perf_counter()
+        payload = storage.snapshot(players, batch)
+        metrics.flush_snapshot.observe(time.perf_counter() - started)
+        
+        try:
+            written = await asyncio.get_running_loop().run_in_executor(_storage_executor, storage.write, payload)
+            print(f"💾 Data saved ({len(batch)} player(s) changed)")
+        except Exception as e:
+            print(f"❌ Error saving data: {e}")
+            metrics.flush_failures += 1
+            for user_id in batch:
+                mark_dirty(user_id)
+            return
+        metrics.flushes.observe(time.perf_counter() - started)
+        metrics.flush_bytes += written or 0
+        metrics.flush_players += len(batch)
+        
+        for user_id, player in players.items():
+            if user_id not in dirty_players and _unsaved_players.get(user_id) is player:
+                del _unsaved_players[user_id]
+
+async def flush_worker():
+    """Coalesce mutations into debounced background flushes"""
+    while True:
+        await _flush_event.wait()
+        while dirty_players:
+            now = time.monotonic()
+            deadline = min(_last_dirty_at + FLUSH_INTERVAL, _first_dirty_at + FLUSH_MAX_DELAY)
+            if now >= deadline:
+                break
+            await asyncio.sleep(deadline - now)
+        _flush_event.clear()
+        await flush_data()
+
+def load_sessions():
+    """Read the last session checkpoint, if any"""
+    global session_store
+    if not os.path.exists(SESSION_FILE):
+        return
+    try:
+        with open(SESSION_FILE, 'r') as f:
+            session_store = json.load(f)
+        print(f"🃏 Restored play state for {len(session_store)} player(s)")
+    except Exception as e:
+        print(f"❌ Error loading session state: {e}")
+
+def store_session(user_id, player):
+    """Copy a resident player's play state into the session store"""
+    state = {}
+    for deck_num, deck in player["decks"].items():
+        if deck["hand"] or deck["discard"] or deck["current_mp"] != deck["max_mp"]:
+            state[deck_num] = {
+                "hand": array('I', deck["hand"]),
+                "discard": array('I', deck["discard"]),
+                "current_mp": deck["current_mp"]
+            }
+    if state:
+        session_store[user_id] = state
+    else:
+        session_store.pop(user_id, None)
+
+def restore_session(user_id, player):
+    """Put checkpointed play state back onto a freshly loaded player"""
+    known = len(card_catalog)
+    for deck_num, state in session_store.get(user_id, {}).items():
+        if deck_num not in DECK_TEMPLATES:
+            continue
+        deck = materialize_deck(player, deck_num)
+        # Cards added after the last durable flush may not have survived a crash
+        deck["hand"] = array('I', [card_id for card_id in state["hand"] if card_id < known])
+        deck["discard"] = array('I', [card_id for card_id in state["discard"] if card_id < known])
+        deck["current_mp"] = state["current_mp"]
+
+def write_session_file(states):
+    """Atomically replace SESSION_FILE (storage thread)"""
+    tmp_path = SESSION_FILE + ".tmp"
+    data = to_json(states)
+    with open(tmp_path, 'w') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, SESSION_FILE)
+    return len(data)
+
+async def checkpoint_sessions():
+    """Checkpoint changed play state without blocking the event loop"""
+    if not session_dirty:
+        return
+    for user_id in session_dirty:
+        player = player_cache.peek(user_id) or _unsaved_players.get(user_id)
+        if player is not None:
+            store_session(user_id, player)
+    session_dirty.clear()
+    # Entries are replaced, never modified, so a shallow copy is safe to dump off the loop
+    states = dict(session_store)
+    started = time.perf_counter()
+    try:
+        written = await asyncio.get_running_loop().run_in_executor(_storage_executor, write_session_file, states)
+    except Exception as e:
+        print(f"❌ Error saving session state: {e}")
+        session_dirty.update(states)
+        return
+    metrics.checkpoints.observe(time.perf_counter() - started)
+    metrics.checkpoint_bytes += written
+
+async def session_worker():
+    """Periodically checkpoint play state"""
+    while True:
+        await asyncio.sleep(SESSION_CHECKPOINT_INTERVAL)
+        await checkpoint_sessions()
+
+DECK_SLOTS = ("1", "2", "3", "4", "5")
+
+def create_default_deck(deck_num):
+    """Create a default deck; deck 1 starts with the base cards"""
+    return {
+        "name": f"Deck {deck_num}",
+        "cards": card_ids(BASE_DECK) if deck_num == "1" else array('I'),
+        "counts": array('I', [1] * len(BASE_DECK)) if deck_num == "1" else array('I'),
+        "hand_size": 6,
+        "max_mp": 10,
+        "current_mp": 10,
+        "stats": "",
+        "hand": array('I'),
+        "discard": array('I'),
+        "reshuffle": True,
+        "page_size": 20,
+        "cost_flags": False
+    }
+
+# Untouched decks are not stored per player: they share one read-only template
+# per slot and only get a private copy (materialize_deck) on their first change
+DECK_TEMPLATES = {}
+
+def build_deck_templates():
+    """(Re)build the shared slot templates against the current card catalog"""
+    for deck_num in DECK_SLOTS:
+        deck = create_default_deck(deck_num)
+        deck["cards"] = tuple(deck["cards"])
+        deck["counts"] = tuple(deck["counts"])
+        deck["hand"] = ()
+        deck["discard"] = ()
+        DECK_TEMPLATES[deck_num] = MappingProxyType(deck)
+
+build_deck_templates()
+
+def is_template_deck(deck, deck_num, ignore=()):
+    """Check whether a deck is indistinguishable from its slot's template (apart from ignored fields)"""
+    template = DECK_TEMPLATES[deck_num]
+    return all(
+        tuple(deck[key]) == value if isinstance(value, tuple) else deck[key] == value
+        for key, value in template.items() if key not in ignore
+    )
+
+def durable_deck(deck):
+    """A deck without its play state, as stored on disk"""
+    return {key: value for key, value in deck.items() if key not in SESSION_FIELDS}
+
+def get_deck(player, deck_num):
+    """Get a deck for reading; may be the shared read-only template"""
+    return player["decks"].get(deck_num) or DECK_TEMPLATES[deck_num]
+
+def materialize_deck(player, deck_num):
+    """Get a deck for writing, giving the player a private copy of the template if needed"""
+    deck = player["decks"].get(deck_num)
+    if deck is None:
+        deck = player["decks"][deck_num] = create_default_deck(deck_num)
+    return deck
+
+def compact_player(player):
+    """Player record with template-equal decks and play state dropped, as stored on disk"""
+    return {
+        "current_deck": player["current_deck"],
+        "decks": {
+            deck_num: durable_deck(deck) for deck_num, deck in player["decks"].items()
+            if deck_num in DECK_TEMPLATES and not is_template_deck(deck, deck_num, SESSION_FIELDS)
+        }
+    }
+
+# Decks are multisets: "cards" holds each distinct card id once and "counts"
+# the number of copies at the same position
+
+QUANTITY_PATTERN = re.compile(r"^(\d+)\s*[xX]\s+(.+)$")
+MAX_CARD_QUANTITY = 1000
+
+def check_quantity(count):
+    """Raise ValueError unless count is a valid number of copies"""
+    if not 1 <= count <= MAX_CARD_QUANTITY:
+        raise ValueError(f"quantity must be between 1 and {MAX_CARD_QUANTITY}")
+    return count
+
+def parse_card_quantity(text):
+    """Split an optional "4x " prefix off a card: returns (count, card text), ValueError on a bad count"""
+    text = text.strip()
+    match = QUANTITY_PATTERN.match(text)
+    if match:
+        return check_quantity(int(match.group(1))), match.group(2).strip()
+    return 1, text
+
+def deck_size(deck):
+    """Total number of card copies in a deck"""
+    return sum(deck["counts"])
+
+def format_entry(card_id, count):
+    text = card_catalog.texts[card_id]
+    return f"{count}x {text}" if count > 1 else text
+
+def deck_entry_texts(deck):
+    """Rendered "3x Fire - 3 Mp" lines for every deck entry"""
+    return [format_entry(card_id, count) for card_id, count in zip(deck["cards"], deck["counts"])]
+
+def normalize_player(player, to_ids=card_ids):
+    """Bring a stored record into resident form: id arrays, untouched decks back on templates"""
+    for deck in player["decks"].values():
+        # Play state lives in the session tier; older records also lack a discard pile
+        deck.setdefault("hand", array('I'))
+        deck.setdefault("discard", array('I'))
+        deck.setdefault("current_mp", deck["max_mp"])
+        deck.setdefault("reshuffle", True)
+        deck.setdefault("page_size", 20)
+        deck.setdefault("cost_flags", False)
+        for key in ("cards", "hand", "discard"):
+            if not isinstance(deck[key], array):
+                # Records from before the catalog store card text
+                deck[key] = to_ids(deck[key])
+        if "counts" not in deck:
+            # Records from before quantities list every copy separately
+            grouped = Counter(deck["cards"])
+            deck["cards"] = array('I', grouped.keys())
+            deck["counts"] = array('I', grouped.values())
+        elif not isinstance(deck["counts"], array):
+            deck["counts"] = array('I', deck["counts"])
+    player["decks"] = {
+        deck_num: deck for deck_num, deck in player["decks"].items()
+        if deck_num in DECK_TEMPLATES and not is_template_deck(deck, deck_num)
+    }
+
+def create_default_player():
+    """Create a default player structure"""
+    return {"current_deck": "1", "decks": {}}
+
+# Players are stored per server. The server of the command or interaction being
+# handled is kept in a context variable (set once per task by the bot, the slash
+# command tree and the views), and player_key() turns a Discord user id into that
+# server's key; keys that are already strings pass through, so internal callers
+# (flushes, checkpoints, the card index) keep working on stored keys directly
+
+current_guild = contextvars.ContextVar("current_guild", default=None)
+
+def enter_guild(guild_id):
+    """Scope player lookups in the running task to a server (None outside servers)"""
+    current_guild.set(guild_id if GUILD_NAMESPACES else None)
+
+def player_key(user_id):
+    """Storage key of a player: "guild id:user id" in a server, the bare user id elsewhere"""
+    if isinstance(user_id, str):
+        return user_id
+    guild_id = current_guild.get()
+    return f"{guild_id}:{user_id}" if guild_id is not None else str(user_id)
+
+def key_guild_id(key):
+    guild_id, _, _ = key.rpartition(":")
+    return int(guild_id) if guild_id else None
+
+def key_user_id(key):
+    return int(key.rpartition(":")[2])
+
+def owns_key(key):
+    """Whether the player's server is served by this process's shards"""
+    if not SHARD_IDS:
+        return True
+    guild_id = key_guild_id(key)
+    if guild_id is None:
+        # Direct messages are delivered to shard 0
+        return 0 in SHARD_IDS
+    return (guild_id >> 22) % SHARD_COUNT in SHARD_IDS
+
+def legacy_record(user_id):
+    """Copy of a player's record from before guild namespaces, if they have one"""
+    legacy_id = user_id.rpartition(":")[2]
+    if legacy_id == user_id:
+        return None
+    record = player_cache.peek(legacy_id) or _unsaved_players.get(legacy_id)
+    if record is None:
+        record = storage.load_player(legacy_id)
+        if record is None:
+            return None
+        # Intern here on the loop: the copy is journaled with card ids, so replaying it never adds cards
+        normalize_player(record)
+    return json.loads(serialize_player(record))
+
+def release_evicted(evicted):
+    """Drop runtime state of players evicted from the cache, keeping unsaved changes for the next flush"""
+    for evicted_id, player in evicted:
+        draw_piles.pop(evicted_id, None)
+        cost_curves.pop(evicted_id, None)
+        invalidate_renders(evicted_id)
+        if evicted_id in session_dirty:
+            store_session(evicted_id, player)
+            session_dirty.discard(evicted_id)
+        if evicted_id in dirty_players:
+            # Write back on eviction: keep the record until the next flush saves it
+            _unsaved_players[evicted_id] = player
+            if _flush_event is not None:
+                _flush_event.set()
+
+def get_player(user_id):
+    """Get player data, loading it from storage or creating it on first use"""
+    user_id = player_key(user_id)
+    player = player_cache.get(user_id)
+    if player is not None:
+        return player
+    
+    legacy = None
+    player = _unsaved_players.get(user_id) or storage.load_player(user_id)
+    if player is not None:
+        if user_id not in session_store and any("hand" in deck for deck in player["decks"].values()):
+            # Record from before the session tier: move its play state over
+            session_dirty.add(user_id)
+        normalize_player(player)
+        restore_session(user_id, player)
+    else:
+        player = create_default_player()
+        card_index.index_player(user_id, player)
+        mark_dirty(user_id)
+        storage.record(user_id, None, "new", ())
+        print(f"✅ Created new player: {user_id}")
+        legacy = legacy_record(user_id)
+    
+    release_evicted(player_cache.put(user_id, player))
+    
+    if legacy is not None:
+        legacy_id = user_id.rpartition(":")[2]
+        mutate(user_id, "load", legacy)
+        if legacy_id in session_store:
+            restore_session(legacy_id, player)
+            session_dirty.add(user_id)
+        print(f"📋 Copied {legacy_id}'s decks into server {key_guild_id(user_id)}")
+    return player
+
+def existing_player(user_id):
+    """Get a player only if they already have a record; never creates one (read-only lookups)"""
+    key = player_key(user_id)
+    if player_cache.peek(key) is None and key not in _unsaved_players and storage.load_player(key) is None:
+        return None
+    return get_player(key)
+
+def get_current_deck(user_id):
+    """Get current deck for a user"""
+    player = get_player(user_id)
+    deck_num = player["current_deck"]
+    
+    # Ensure the deck exists (for legacy data)
+    if deck_num not in DECK_TEMPLATES:
+        print(f"⚠️ Deck {deck_num} not found for {user_id}, resetting to deck 1")
+        player["current_deck"] = "1"
+        deck_num = "1"
+    
+    return get_deck(player, deck_num)
+
+# Draw piles are runtime-only: the undrawn cards are always the deck minus
+# the hand and discard pile, so they are rebuilt from those after a restart
+# or a deck change instead of being stored
+
+class DrawPile:
+    """Every copy of a deck in one array; the first `left` copies are still in the draw pile"""
+    
+    __slots__ = ("cards", "left")
+    
+    def __init__(self, deck):
+        held = Counter(deck["hand"])
+        held.update(deck["discard"])
+        undrawn, drawn = array('I'), array('I')
+        for card_id, count in zip(deck["cards"], deck["counts"]):
+            out = min(held[card_id], count)
+            undrawn.extend(array('I', [card_id]) * (count - out))
+            drawn.extend(array('I', [card_id]) * out)
+        self.cards = undrawn + drawn
+        self.left = len(undrawn)
+    
+    def draw(self):
+        """Take a random card off the pile (swap-remove, so O(1))"""
+        pos = random.randrange(self.left)
+        self.left -= 1
+        cards = self.cards
+        cards[pos], cards[self.left] = cards[self.left], cards[pos]
+        return cards[self.left]
+    
+    def reset(self):
+        """Put every copy back into the draw pile"""
+        self.left = len(self.cards)
+    
+    def restore(self, card_ids):
+        """Shuffle drawn copies (the discard pile) back into the draw pile"""
+        wanted = Counter(card_ids)
+        cards = self.cards
+        for pos in range(self.left, len(cards)):
+            card_id = cards[pos]
+            if wanted[card_id]:
+                wanted[card_id] -= 1
+                cards[pos], cards[self.left] = cards[self.left], card_id
+                self.left += 1
+
+draw_piles = {}  # user id -> {deck num: DrawPile}
+
+def get_pile(user_id):
+    """Current deck of a player and its draw pile, building the pile on first use"""
+    user_id = player_key(user_id)
+    deck = get_current_deck(user_id)
+    piles = draw_piles.setdefault(user_id, {})
+    deck_num = get_player(user_id)["current_deck"]
+    pile = piles.get(deck_num)
+    if pile is None:
+        pile = piles[deck_num] = DrawPile(deck)
+    return deck, pile
+
+# MP curves: user id -> {deck num: Counter of MP cost -> copies}. A curve is
+# built once per deck and then kept current by mutate() from each op's own
+# arguments, so $curve never rescans the deck
+
+cost_curves = {}
+
+def get_cost_curve(user_id):
+    """Current deck of a player and its MP curve (cost None counts cards without one)"""
+    user_id = player_key(user_id)
+    deck = get_current_deck(user_id)
+    curves = cost_curves.setdefault(user_id, {})
+    deck_num = get_player(user_id)["current_deck"]
+    curve = curves.get(deck_num)
+    if curve is None:
+        curve = curves[deck_num] = Counter()
+        for card_id, count in zip(deck["cards"], deck["counts"]):
+            curve[card_catalog.cost(card_id)] += count
+    return deck, curve
+
+def update_cost_curve(user_id, deck_num, op, args, result):
+    """Fold a deck op's card changes into the deck's cached curve, or drop it for wholesale changes"""
+    curve = cost_curves.get(user_id, {}).get(deck_num)
+    if curve is None:
+        return
+    if op == "add":
+        counts = args[1] if len(args) > 1 and args[1] is not None else None
+        for card_id, count in zip(card_ids(args[0]), counts or [1] * len(args[0])):
+            curve[card_catalog.cost(card_id)] += count
+    elif op == "remove":
+        curve.subtract(card_catalog.cost(card_id) for card_id in result)
+        for cost in [cost for cost, count in curve.items() if count <= 0]:
+            del curve[cost]
+    else:
+        del cost_curves[user_id][deck_num]
+
+def hand_cost_line(deck):
+    """Total MP cost of the hand against the MP available"""
+    costs = [card_catalog.cost(card_id) for card_id in deck["hand"]]
+    total = sum(cost for cost in costs if cost is not None)
+    if total <= deck["current_mp"]:
+        line = f"💧 Hand cost: {total} MP - all castable with {deck['current_mp']} MP"
+    else:
+        line = f"💧 Hand cost: {total} MP - {total - deck['current_mp']} MP more than the {deck['current_mp']} available"
+    uncosted = costs.count(None)
+    if uncosted:
+        line += f" ({uncosted} card(s) without an MP cost)"
+    return line
+
+# $find answers "who holds this card" from an inverted index: card text
+# tokens -> card ids -> decks. It is built once in the background from
+# storage and then kept current by mutate(), so queries never scan decks
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+class CardIndex:
+    """Inverted index from card text tokens to card ids and from card ids to the decks holding them"""
+    
+    def __init__(self):
+        self.tokens = {}  # token -> set of card ids
+        self.tokenized = 0  # catalog entries already tokenized
+        self.holders = {}  # card id -> set of (user id, deck num)
+        self.decks = {}  # (user id, deck num) -> set of card ids indexed for it
+        self.base_players = set()  # players whose Deck 1 is still the shared base template
+        self.players = set()  # every indexed player key
+        self.indexed_players = 0
+        self.ready = False
+    
+    def index_deck(self, user_id, deck_num, player):
+        """Re-index one deck slot of a player after its cards changed"""
+        deck = player["decks"].get(deck_num)
+        self._set_deck(user_id, deck_num, set(deck["cards"]) if deck is not None else None)
+    
+    def _set_deck(self, user_id, deck_num, cards):
+        """Record the card ids of a deck slot; cards is None for a slot still on its template"""
+        key = (user_id, deck_num)
+        new = cards or set()
+        old = self.decks.pop(key, set())
+        for card_id in old - new:
+            holders = self.holders[card_id]
+            holders.discard(key)
+            if not holders:
+                del self.holders[card_id]
+        for card_id in new - old:
+            self.holders.setdefault(card_id, set()).add(key)
+        if new:
+            self.decks[key] = new
+        if deck_num == "1":
+            if cards is None:
+                self.base_players.add(user_id)
+            else:
+                self.base_players.discard(user_id)
+    
+    def index_player(self, user_id, player):
+        self.players.add(user_id)
+        for deck_num in DECK_SLOTS:
+            self.index_deck(user_id, deck_num, player)
+    
+    def index_stored(self, user_id, deck_cards):
+        self.players.add(user_id)
+        for deck_num in DECK_SLOTS:
+            self._set_deck(user_id, deck_num, deck_cards.get(deck_num))
+    
+    async def build(self):
+        """Index every stored player; records are read and parsed on the storage thread a slice at a time"""
+        loop = asyncio.get_running_loop()
+        records = storage.iter_players()
+        while True:
+            chunk = await loop.run_in_executor(_storage_executor, read_index_chunk, records, INDEX_CHUNK)
+            if not chunk:
+                break
+            for user_id, deck_cards, player in chunk:
+                # Resident records may be newer than what storage has
+                resident = player_cache.peek(user_id) or _unsaved_players.get(user_id)
+                if resident is not None:
+                    self.index_player(user_id, resident)
+                elif deck_cards is not None:
+                    self.index_stored(user_id, deck_cards)
+                else:
+                    normalize_player(player)
+                    self.index_player(user_id, player)
+                self.indexed_players += 1
+        self.ready = True
+        print(f"🔎 Indexed cards of {self.indexed_players} player(s)")
+    
+    def in_guild(self, user_id, guild_id):
+        """Whether an indexed player counts as a member of a server's player base"""
+        key_guild = key_guild_id(user_id)
+        if key_guild == guild_id:
+            return True
+        # Records from before guild namespaces stand in for players not yet copied into the server
+        return key_guild is None and f"{guild_id}:{user_id}" not in self.players
+    
+    def matching_cards(self, query):
+        """Card ids whose text contains every word of the query"""
+        texts = card_catalog.texts
+        for card_id in range(self.tokenized, len(texts)):
+            for token in set(TOKEN_PATTERN.findall(texts[card_id].casefold())):
+                self.tokens.setdefault(token, set()).add(card_id)
+        self.tokenized = len(texts)
+        
+        words = TOKEN_PATTERN.findall(query.casefold())
+        if not words:
+            return set()
+        candidates = sorted((self.tokens.get(word, set()) for word in words), key=len)
+        return candidates[0].intersection(*candidates[1:])
+
+card_index = CardIndex()
+
+# Players read per storage thread round trip while the index is built
+INDEX_CHUNK = 200
+
+def stored_deck_cards(player):
+    """Card id set of each stored deck slot, or None for an older record that needs normalize_player"""
+    deck_cards = {}
+    for deck_num, deck in player["decks"].items():
+        if "counts" not in deck or not all(isinstance(card_id, int) for card_id in deck["cards"]):
+            return None
+        if deck_num in DECK_TEMPLATES:
+            deck_cards[deck_num] = set(deck["cards"])
+    return deck_cards
+
+def read_index_chunk(records, size):
+    """Next (user id, deck card sets, record) slice of stored players for the card index (storage thread)"""
+    chunk = []
+    for user_id, player in records:
+        if not owns_key(user_id):
+            continue
+        deck_cards = stored_deck_cards(player)
+        chunk.append((user_id, deck_cards, player if deck_cards is None else None))
+        if len(chunk) >= size:
+            break
+    return chunk
+
+# Every change to player data goes through an operation so that it can be
+# journaled as a compact delta and replayed on startup
+
+def _op_set(player, deck_num, field, value):
+    materialize_deck(player, deck_num)[field] = value
+
+def _op_add(player, deck_num, cards, counts=None):
+    deck = materialize_deck(player, deck_num)
+    ids = card_ids(cards)
+    # One position lookup table instead of a scan per card, so big imports stay linear
+    positions = {card_id: pos for pos, card_id in enumerate(deck["cards"])}
+    for card_id, count in zip(ids, counts or [1] * len(ids)):
+        pos = positions.get(card_id)
+        if pos is None:
+            positions[card_id] = len(deck["cards"])
+            deck["cards"].append(card_id)
+            deck["counts"].append(count)
+        else:
+            deck["counts"][pos] += count
+
+def _op_hand(player, deck_num, cards):
+    # A fresh hand starts a new round with every other card back in the pile
+    deck = materialize_deck(player, deck_num)
+    deck["hand"] = card_ids(cards)
+    deck["discard"] = array('I')
+
+def _op_discard(player, deck_num, indices):
+    """Move cards from the hand (0-based positions) to the discard pile"""
+    deck = materialize_deck(player, deck_num)
+    hand = deck["hand"]
+    for idx in sorted(set(indices), reverse=True):
+        deck["discard"].append(hand.pop(idx))
+
+def _op_reshuffle(player, deck_num):
+    materialize_deck(player, deck_num)["discard"] = array('I')
+
+def _op_remove(player, deck_num, indices):
+    """Remove one copy per 1-based entry number (repeat a number for more), returning them in deck order"""
+    deck = materialize_deck(player, deck_num)
+    cards, counts = deck["cards"], deck["counts"]
+    removed = []
+    for idx, quantity in sorted(Counter(indices).items(), reverse=True):
+        pos = idx - 1
+        taken = min(quantity, counts[pos])
+        removed[:0] = [cards[pos]] * taken
+        counts[pos] -= taken
+        if not counts[pos]:
+            del cards[pos]
+            del counts[pos]
+    return removed
+
+def _op_clear(player, deck_num):
+    deck = materialize_deck(player, deck_num)
+    deck["cards"] = array('I')
+    deck["counts"] = array('I')
+
+def _op_default(player, deck_num):
+    deck = materialize_deck(player, deck_num)
+    deck["cards"] = card_ids(BASE_DECK)
+    deck["counts"] = array('I', [1] * len(BASE_DECK))
+
+def _op_reset(player, deck_num):
+    # Back to sharing the slot template
+    player["decks"].pop(deck_num, None)
+
+def _op_replace(player, deck_num, replacements):
+    deck = materialize_deck(player, deck_num)
+    hand = deck["hand"]
+    for idx, card in replacements:
+        deck["discard"].append(hand[idx])
+        hand[idx] = card_ids([card])[0]
+
+def _op_mp(player, deck_num, change):
+    materialize_deck(player, deck_num)["current_mp"] += change
+
+def _op_max_mp(player, deck_num, value):
+    deck = materialize_deck(player, deck_num)
+    deck["max_mp"] = value
+    deck["current_mp"] = value
+
+def _op_switch(player, deck_num, new_deck_num):
+    player["current_deck"] = new_deck_num
+    deck = get_deck(player, new_deck_num)
+    if deck["hand"] or deck["discard"] or deck["current_mp"] != deck["max_mp"]:
+        deck = materialize_deck(player, new_deck_num)
+        deck["hand"] = array('I')
+        deck["discard"] = array('I')
+        deck["current_mp"] = deck["max_mp"]
+
+def _op_load(player, deck_num, record):
+    """Replace the whole player with a stored record (a copy, so the journaled args stay untouched)"""
+    loaded = json.loads(to_json(record))
+    normalize_player(loaded)
+    player["current_deck"] = loaded["current_deck"]
+    player["decks"] = loaded["decks"]
+
+DECK_OPS = {
+    "set": _op_set,
+    "add": _op_add,
+    "hand": _op_hand,
+    "remove": _op_remove,
+    "clear": _op_clear,
+    "default": _op_default,
+    "reset": _op_reset,
+    "replace": _op_replace,
+    "discard": _op_discard,
+    "reshuffle": _op_reshuffle,
+    "mp": _op_mp,
+    "max_mp": _op_max_mp,
+}
+PLAYER_OPS = {
+    "switch": _op_switch,
+    "load": _op_load,
+}
+# Ops that change which cards a deck holds, invalidating its draw pile
+PILE_RESET_OPS = {"add", "remove", "clear", "default", "reset", "load"}
+# Ops that only touch play state; they never reach storage or the journal
+SESSION_OPS = {"hand", "replace", "discard", "reshuffle", "mp"}
+
+def apply_op(player, deck_num, op, args):
+    """Apply one operation to a player record"""
+    handler = PLAYER_OPS.get(op) or DECK_OPS[op]
+    return handler(player, deck_num, *args)
+
+def replay_op(data, user_id, deck_num, op, args):
+    """Apply a journaled operation to a loaded data set"""
+    if op == "new":
+        data[user_id] = create_default_player()
+        return
+    if user_id not in data:
+        data[user_id] = create_default_player()
+    apply_op(data[user_id], deck_num, op, args)
+
+def mutate(user_id, op, *args, deck_num=None):
+    """Apply an operation to a player's deck (current deck by default) and queue it for saving"""
+    user_id = player_key(user_id)
+    player = get_player(user_id)
+    if deck_num is None:
+        get_current_deck(user_id)
+        deck_num = player["current_deck"]
+    result = apply_op(player, deck_num, op, args)
+    if op in PLAYER_OPS:
+        draw_piles.pop(user_id, None)
+        cost_curves.pop(user_id, None)
+        if op in PILE_RESET_OPS:
+            card_index.index_player(user_id, player)
+        invalidate_renders(user_id)
+    else:
+        if op in PILE_RESET_OPS:
+            draw_piles.get(user_id, {}).pop(deck_num, None)
+            update_cost_curve(user_id, deck_num, op, args, result)
+            card_index.index_deck(user_id, deck_num, player)
+        invalidate_renders(user_id, deck_num)
+    session_dirty.add(user_id)
+    if op not in SESSION_OPS:
+        mark_dirty(user_id, None if op in PLAYER_OPS else deck_num)
+        storage.record(user_id, deck_num, op, args)
+    # Decks grow and templates get materialized; keep the byte bound honest
+    release_evicted(player_cache.resize(user_id))
+    return result
+
+# ===== RENDERING =====
+
+MESSAGE_PAGE_SIZE = 1900
+
+def deck_version(user_id, deck_num=None):
+    key = (user_id, deck_num)
+    version = deck_versions.get(key)
+    if version is None:
+        version = deck_versions[key] = next(_version_counter)
+    return version
+
+def invalidate_renders(user_id, deck_num=None):
+    """Bump a deck's version (every deck when deck_num is None) and the player's"""
+    for slot in DECK_SLOTS if deck_num is None else (deck_num,):
+        deck_versions.pop((user_id, slot), None)
+    deck_versions.pop((user_id, None), None)
+
+def cached_render(user_id, deck_num, view, render):
+    """Return render() for a view of a deck, reusing the last result while the deck is unchanged"""
+    user_id = player_key(user_id)
+    key = (user_id, deck_num, view)
+    version = deck_version(user_id, deck_num)
+    rendered = render_cache.get(key, version)
+    if rendered is None:
+        rendered = render()
+        render_cache.put(key, version, rendered)
+    return rendered
+
+def paginate(lines, header=""):
+    """Split lines into Discord-sized pages without breaking any line"""
+    pages = []
+    page = header
+    for line in lines:
+        if page and len(page) + len(line) + 1 > MESSAGE_PAGE_SIZE:
+            pages.append(page)
+            page = ""
+        page += line + "\n"
+    if page:
+        pages.append(page)
+    return pages
+
+def numbered(texts):
+    return [f"{i}. {text}" for i, text in enumerate(texts, 1)]
+
+def render_hand(target, note=""):
+    """Hand message with the MP header; note is appended to the header"""
+    player = get_player(target.id)
+    deck_num = player["current_deck"]
+    current = get_current_deck(target.id)
+    header = f"**{target.display_name}'s {current['name']}** - MP: {current['current_mp']}/{current['max_mp']}{note}\n"
+    body = cached_render(target.id, deck_num, "hand", lambda: render_hand_body(current))
+    return header + body
+
+def render_hand_body(deck):
+    """Numbered hand, unaffordable cards flagged if the deck asks for it, and the hand's MP cost"""
+    texts = card_texts(deck["hand"])
+    if deck["cost_flags"]:
+        texts = [
+            f"{text} ⚠️" if (card_catalog.cost(card_id) or 0) > deck["current_mp"] else text
+            for card_id, text in zip(deck["hand"], texts)
+        ]
+    lines = numbered(texts)
+    if deck["hand"]:
+        lines.append(hand_cost_line(deck))
+    return "".join(line + "\n" for line in lines)
+
+def render_cards(target):
+    """Pages listing the current deck's entries"""
+    current = get_current_deck(target.id)
+    deck_num = get_player(target.id)["current_deck"]
+    header = f"**{target.display_name}'s {current['name']}** ({deck_size(current)} cards):\n"
+    return cached_render(target.id, deck_num, ("cards", target.display_name), lambda: paginate(numbered(deck_entry_texts(current)), header))
+
+def render_decks(target):
+    """Pages with every deck slot and a short preview"""
+    player = get_player(target.id)
+    
+    def render():
+        lines = [f"**{target.display_name}'s Decks:**"]
+        for deck_num in DECK_SLOTS:
+            deck = get_deck(player, deck_num)
+            current_marker = "✅ " if player["current_deck"] == deck_num else ""
+            lines.append(f"\n{current_marker}**Deck {deck_num}: {deck['name']}** ({deck_size(deck)} cards)")
+            
+            # Show preview of first 3 cards
+            if deck["cards"]:
+                entries = [format_entry(card_id, count) for card_id, count in zip(deck["cards"][:3], deck["counts"][:3])]
+                preview = ", ".join([f"`{c[:20]}...`" if len(c) > 20 else f"`{c}`" for c in entries])
+                if len(deck["cards"]) > 3:
+                    preview += f" and {len(deck['cards']) - 3} more"
+                lines.append(f"Preview: {preview}")
+            else:
+                lines.append("Preview: *Empty deck*")
+        return paginate(lines)
+    
+    return cached_render(target.id, None, ("decks", target.display_name), render)
+
+# ===== PAGINATION =====
+
+EMBED_DESCRIPTION_LIMIT = 4096
+
+def render_cards_page(target, deck_num, page):
+    """One embed page of a deck's entries, rendered on demand; returns (embed, page count)"""
+    deck = get_deck(get_player(target.id), deck_num)
+    size = deck["page_size"]
+    page_count = max(1, -(-len(deck["cards"]) // size))
+    page = min(page, page_count - 1)
+    start = page * size
+    
+    def render():
+        entries = zip(deck["cards"][start:start + size], deck["counts"][start:start + size])
+        return "\n".join(f"{i}. {format_entry(card_id, copies)}" for i, (card_id, copies) in enumerate(entries, start + 1))
+    
+    body = cached_render(target.id, deck_num, ("cards page", page, size), render)
+    embed = discord.Embed(title=f"{target.display_name}'s {deck['name']} ({deck_size(deck)} cards)", description=body[:EMBED_DESCRIPTION_LIMIT])
+    embed.set_footer(text=f"Page {page + 1}/{page_count}")
+    return embed, page_count
+
+def render_text_page(pages):
+    """Page renderer over already rendered text pages"""
+    def render_page(page):
+        page = min(page, len(pages) - 1)
+        embed = discord.Embed(description=pages[page])
+        embed.set_footer(text=f"Page {page + 1}/{len(pages)}")
+        return embed, len(pages)
+    return render_page
+
+class JumpModal(discord.ui.Modal, title="Jump to page"):
+    page = discord.ui.TextInput(label="Page number", max_length=5)
+    
+    def __init__(self, view):
+        super().__init__()
+        self.paged_view = view
+    
+    async def on_submit(self, interaction):
+        enter_guild(interaction.guild_id)
+        try:
+            page = int(self.page.value) - 1
+        except ValueError:
+            await interaction.response.send_message("❌ Enter a page number!", ephemeral=True)
+            return
+        await self.paged_view.show(interaction, page)
+
+class PagedView(discord.ui.View):
+    """One message with prev/jump/next buttons that is edited in place on every page turn"""
+    
+    def __init__(self, owner_id, render_page):
+        super().__init__(timeout=PAGE_VIEW_TIMEOUT)
+        self.owner_id = owner_id
+        self.render_page = render_page  # page index -> (embed, page count)
+        self.page = 0
+        self.message = None
+    
+    def render(self):
+        embed, page_count = self.render_page(self.page)
+        self.page = min(self.page, page_count - 1)
+        self.prev_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= page_count - 1
+        return embed
+    
+    async def show(self, interaction, page):
+        self.page = max(0, page)
+        await interaction.response.edit_message(embed=self.render(), view=self)
+    
+    async def interaction_check(self, interaction):
+        enter_guild(interaction.guild_id)
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("❌ Only the person who ran the command can turn pages!", ephemeral=True)
+            return False
+        return True
+    
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def prev_page(self, interaction, button):
+        await self.show(interaction, self.page - 1)
+    
+    @discord.ui.button(label="Jump", style=discord.ButtonStyle.primary)
+    async def jump_page(self, interaction, button):
+        await interaction.response.send_modal(JumpModal(self))
+    
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction, button):
+        await self.show(interaction, self.page + 1)
+    
+    async def on_timeout(self):
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+async def send_paged(ctx, render_page):
+    """Send the first page with page buttons"""
+    view = PagedView(ctx.author.id, render_page)
+    view.message = await ctx.send(embed=view.render(), view=view)
+
+# ===== HAND UI =====
+
+def deal_hand(user_id):
+    """Draw a fresh hand from a full pile; False if the deck is smaller than the hand size"""
+    current, pile = get_pile(user_id)
+    if deck_size(current) < current["hand_size"]:
+        return False
+    pile.reset()
+    mutate(user_id, "hand", array('I', [pile.draw() for _ in range(current["hand_size"])]))
+    return True
+
+MAX_HAND_BUTTONS = 20  # four rows of toggles, the fifth row holds the controls
+
+def replace_from_pile(user_id, numbers):
+    """Replace 1-based hand positions with cards off the draw pile; returns (replaced, skipped)"""
+    current, pile = get_pile(user_id)
+    replaced = []
+    for num in numbers:
+        if 1 <= num <= len(current["hand"]) and num not in replaced:
+            replaced.append(num)
+    
+    # Reshuffle the discard pile back in if the draw pile runs short
+    if pile.left < len(replaced) and current["discard"] and current["reshuffle"]:
+        pile.restore(current["discard"])
+        mutate(user_id, "reshuffle")
+    
+    # Draw replacements off the pile; the old cards go to the discard pile
+    skipped = replaced[pile.left:]
+    replaced = replaced[:pile.left]
+    mutate(user_id, "replace", [[num - 1, pile.draw()] for num in replaced])
+    return replaced, skipped
+
+class HandView(discord.ui.View):
+    """Buttons under a drawn hand: toggle cards, replace them, adjust MP; edits the hand message in place"""
+    
+    def __init__(self, target):
+        super().__init__(timeout=HAND_VIEW_TIMEOUT)
+        self.target = target
+        self.selected = set()
+        self.message = None
+        self.build()
+    
+    def build(self):
+        """(Re)create the buttons for the current hand"""
+        self.clear_items()
+        hand_size = len(get_current_deck(self.target.id)["hand"])
+        self.selected = {num for num in self.selected if num <= hand_size}
+        for num in range(1, min(hand_size, MAX_HAND_BUTTONS) + 1):
+            style = discord.ButtonStyle.success if num in self.selected else discord.ButtonStyle.secondary
+            self.add_control(str(num), style, (num - 1) // 5, self.toggle, num)
+        self.add_control("Replace", discord.ButtonStyle.primary, 4, self.confirm, disabled=not self.selected)
+        self.add_control("MP -1", discord.ButtonStyle.danger, 4, self.change_mp, -1)
+        self.add_control("MP +1", discord.ButtonStyle.success, 4, self.change_mp, 1)
+        self.add_control("MP max", discord.ButtonStyle.secondary, 4, self.change_mp, None)
+    
+    def add_control(self, label, style, row, action, *args, disabled=False):
+        button = discord.ui.Button(label=label, style=style, row=row, disabled=disabled)
+        
+        async def callback(interaction):
+            await action(interaction, *args)
+        
+        button.callback = callback
+        self.add_item(button)
+    
+    async def refresh(self, interaction, note="", warning=""):
+        self.build()
+        await interaction.response.edit_message(content=render_hand(self.target, note) + warning, view=self)
+    
+    async def interaction_check(self, interaction):
+        enter_guild(interaction.guild_id)
+        permissions = getattr(interaction.user, "guild_permissions", None)
+        if interaction.user.id != self.target.id and not (permissions and permissions.administrator):
+            await interaction.response.send_message("❌ Only this hand's player (or an admin) can use these buttons!", ephemeral=True)
+            return False
+        return True
+    
+    async def toggle(self, interaction, num):
+        self.selected ^= {num}
+        self.build()
+        await interaction.response.edit_message(view=self)
+    
+    async def confirm(self, interaction):
+        async with player_locks.hold(self.target.id):
+            replaced, skipped = replace_from_pile(self.target.id, sorted(self.selected))
+            self.selected.clear()
+            warning = f"⚠️ Draw pile is empty, kept {', '.join(map(str, skipped))}" if skipped else ""
+            await self.refresh(interaction, f" (replaced {', '.join(map(str, replaced)) or 'none'})", warning)
+    
+    async def change_mp(self, interaction, change):
+        async with player_locks.hold(self.target.id):
+            current = get_current_deck(self.target.id)
+            if change is None:
+                change = current["max_mp"] - current["current_mp"]
+            mutate(self.target.id, "mp", change)
+            await self.refresh(interaction, f" ({change:+d} MP)")
+    
+    async def on_timeout(self):
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+class PlayerLocks:
+    """Per-player asyncio locks, striped over a fixed pool so memory stays bounded"""
+    
+    def __init__(self, stripes):
+        self.locks = [asyncio.Lock() for _ in range(stripes)]
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+    
+    def stripes_for(self, user_ids):
+        return sorted({hash(str(user_id)) % len(self.locks) for user_id in user_ids})
+    
+    async def acquire(self, user_ids):
+        """Lock the stripes of all given players, in index order so overlapping sets can't deadlock"""
+        stripes = self.stripes_for(user_ids)
+        start = time.monotonic()
+        contended = False
+        held = []
+        try:
+            for stripe in stripes:
+                lock = self.locks[stripe]
+                contended = contended or lock.locked()
+                await lock.acquire()
+                held.append(stripe)
+        except BaseException:
+            self.release(held)
+            raise
+        waited = time.monotonic() - start
+        self.acquisitions += 1
+        self.contended += contended
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        return stripes
+    
+    def release(self, stripes):
+        for stripe in reversed(stripes):
+            self.locks[stripe].release()
+    
+    @contextlib.asynccontextmanager
+    async def hold(self, *user_ids):
+        stripes = await self.acquire(user_ids)
+        try:
+            yield
+        finally:
+            self.release(stripes)
+
+player_locks = PlayerLocks(PLAYER_LOCK_STRIPES)
+
+# ===== INSTRUMENTATION =====
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is unbounded
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram: constant memory and an O(log n) update per observation"""
+    
+    __slots__ = ("buckets", "count", "total", "max")
+    
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+    
+    def observe(self, seconds):
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+    
+    def quantile(self, q):
+        """Estimate: upper bound of the bucket holding the q-th observation, capped at the max seen"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, observed in zip(LATENCY_BUCKETS, self.buckets):
+            seen += observed
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+    
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+    
+    def cumulative(self):
+        """(upper bound, observations at or below it) pairs, Prometheus style"""
+        seen = 0
+        for bound, observed in zip(LATENCY_BUCKETS + (math.inf,), self.buckets):
+            seen += observed
+            yield bound, seen
+
+class Metrics:
+    """Process-wide latency histograms and counters behind $perf and the metrics endpoint"""
+    
+    def __init__(self):
+        self.started = time.monotonic()
+        self.commands = {}  # qualified command name ("/name" for slash commands) -> LatencyHistogram
+        self.command_failures = Counter()
+        self.replies = LatencyHistogram()  # queued reply -> its message sent
+        self.errors = Counter()  # exception type name -> count, from on_command_error
+        self.flushes = LatencyHistogram()
+        self.flush_snapshot = LatencyHistogram()
+        self.flush_failures = 0
+        self.flush_bytes = 0
+        self.flush_players = 0
+        self.checkpoints = LatencyHistogram()
+        self.checkpoint_bytes = 0
+        self.loop_lag = LatencyHistogram()
+        self.loop_lag_last = 0.0
+    
+    def observe_command(self, name, seconds, failed=False):
+        histogram = self.commands.get(name)
+        if histogram is None:
+            histogram = self.commands[name] = LatencyHistogram()
+        histogram.observe(seconds)
+        if failed:
+            self.command_failures[name] += 1
+
+metrics = Metrics()
+
+async def loop_lag_worker():
+    """Measure event loop lag: how much later than asked a short sleep wakes up"""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = max(0.0, time.perf_counter() - started - LOOP_LAG_INTERVAL)
+        metrics.loop_lag.observe(lag)
+        metrics.loop_lag_last = lag
+
+def gateway_latencies():
+    """(shard id, heartbeat latency in seconds) for each connected shard"""
+    latencies = bot.latencies if SHARDED else [(0, bot.latency)]
+    return [(shard_id, latency) for shard_id, latency in latencies if not math.isnan(latency) and not math.isinf(latency)]
+
+def prometheus_histogram(lines, name, histogram, labels=""):
+    for bound, seen in histogram.cumulative():
+        le = "+Inf" if math.isinf(bound) else repr(bound)
+        separator = "," if labels else ""
+        lines.append(f'{name}_bucket{{{labels}{separator}le="{le}"}} {seen}')
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {histogram.total}")
+    lines.append(f"{name}_count{suffix} {histogram.count}")
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    
+    def metric(name, kind, help_text, value=None):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if value is not None:
+            lines.append(f"{name} {value}")
+    
+    metric("mythos_uptime_seconds", "gauge", "Seconds since the bot started.", time.monotonic() - metrics.started)
+    metric("mythos_command_duration_seconds", "histogram", "Command latency from invoke until it returns; queued replies count until queued, views and files until sent.")
+    for name, histogram in sorted(metrics.commands.items()):
+        prometheus_histogram(lines, "mythos_command_duration_seconds", histogram, f'command="{name}"')
+    metric("mythos_command_failures_total", "counter", "Commands that raised an error.")
+    for name, failures in sorted(metrics.command_failures.items()):
+        lines.append(f'mythos_command_failures_total{{command="{name}"}} {failures}')
+    metric("mythos_command_errors_total", "counter", "Errors seen by the global error handler, by type.")
+    for error_type, seen in sorted(metrics.errors.items()):
+        lines.append(f'mythos_command_errors_total{{type="{error_type}"}} {seen}')
+    
+    metric("mythos_flush_duration_seconds", "histogram", "Write-behind flush time, snapshot plus storage write.")
+    prometheus_histogram(lines, "mythos_flush_duration_seconds", metrics.flushes)
+    metric("mythos_flush_snapshot_seconds", "histogram", "Time a flush spends serializing on the event loop.")
+    prometheus_histogram(lines, "mythos_flush_snapshot_seconds", metrics.flush_snapshot)
+    metric("mythos_flush_bytes_total", "counter", "Bytes written by flushes.", metrics.flush_bytes)
+    metric("mythos_flush_players_total", "counter", "Player records written by flushes.", metrics.flush_players)
+    metric("mythos_flush_failures_total", "counter", "Flushes that failed and were retried.", metrics.flush_failures)
+    metric("mythos_session_checkpoint_seconds", "histogram", "Session state checkpoint time.")
+    prometheus_histogram(lines, "mythos_session_checkpoint_seconds", metrics.checkpoints)
+    metric("mythos_session_checkpoint_bytes_total", "counter", "Bytes written by session checkpoints.", metrics.checkpoint_bytes)
+    metric("mythos_dirty_players", "gauge", "Players with changes not yet flushed.", len(dirty_players))
+    
+    metric("mythos_event_loop_lag_seconds", "histogram", "How late the event loop wakes a sleeping task.")
+    prometheus_histogram(lines, "mythos_event_loop_lag_seconds", metrics.loop_lag)
+    metric("mythos_gateway_latency_seconds", "gauge", "Gateway heartbeat latency per shard.")
+    for shard_id, latency in gateway_latencies():
+        lines.append(f'mythos_gateway_latency_seconds{{shard="{shard_id}"}} {latency}')
+    
+    metric("mythos_player_cache_players", "gauge", "Players resident in the cache.", len(player_cache))
+    metric("mythos_player_cache_bytes", "gauge", "Approximate size of the player cache.", player_cache.total_bytes)
+    metric("mythos_player_cache_hits_total", "counter", "Player cache hits.", player_cache.hits)
+    metric("mythos_player_cache_misses_total", "counter", "Player cache misses.", player_cache.misses)
+    metric("mythos_player_cache_evictions_total", "counter", "Player cache evictions.", player_cache.evictions)
+    metric("mythos_render_cache_hits_total", "counter", "Render cache hits.", render_cache.hits)
+    metric("mythos_render_cache_misses_total", "counter", "Render cache misses.", render_cache.misses)
+    metric("mythos_lock_acquisitions_total", "counter", "Player lock acquisitions.", player_locks.acquisitions)
+    metric("mythos_lock_contended_total", "counter", "Player lock acquisitions that had to wait.", player_locks.contended)
+    metric("mythos_lock_wait_seconds_total", "counter", "Total time spent waiting for player locks.", player_locks.wait_total)
+    metric("mythos_outbound_queue_depth", "gauge", "Replies waiting in the outbound queue.", outbound.depth())
+    metric("mythos_outbound_messages_total", "counter", "Messages sent by the outbound queue.", outbound.sent)
+    metric("mythos_outbound_coalesced_total", "counter", "Replies merged into another message.", outbound.coalesced)
+    metric("mythos_reply_delivery_seconds", "histogram", "Time from a reply being queued to its message being sent.")
+    prometheus_histogram(lines, "mythos_reply_delivery_seconds", metrics.replies)
+    metric("mythos_member_lookups_total", "counter", "Member mentions resolved.", member_resolver.resolved)
+    metric("mythos_member_fetches_total", "counter", "Member lookups that needed an API call.", member_resolver.fetches)
+    return "\n".join(lines) + "\n"
 
-# Base deck
-BASE_DECK = [
-    "Fire - 3 Mp",
-    "Wind - 3 Mp", 
-    "Water - 3 Mp",
-    "Earth - 3 Mp",
-    "Ball - 2 Mp",
-    "Bolt - 2 Mp",
-    "Wall - 3 Mp",
-    "Burst - 3 Mp",
-    "Forward - 1 Mp",
-    "Down - 1 Mp",
-    "Orbit - 2 Mp",
-    "Split - 2 Mp"
-]
+async def metrics_handler(request):
+    return web.Response(text=render_prometheus(), content_type="text/plain", charset="utf-8", headers={"Cache-Control": "no-store"})
 
-# File for data persistence
-DATA_FILE = "player_data.json"
+async def start_metrics_server():
+    """Serve GET /metrics on METRICS_HOST:METRICS_PORT"""
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+    print(f"📈 Metrics at http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    return runner
 
-# Player data structure
-player_data = {}
+# ===== OUTBOUND QUEUE =====
 
-def load_data():
-    """Load player data from file"""
-    global player_data
-    try:
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, 'r') as f:
-                player_data = json.load(f)
-            print(f"✅ Loaded data for {len(player_data)} players")
+MESSAGE_LIMIT = 2000
+GAMEPLAY, BULK = 0, 1
+# Listings that can wait behind gameplay replies in a busy channel
+BULK_COMMANDS = {"cards", "decks", "discard", "find", "helpme"}
+
+class ChannelQueue:
+    """Pending replies and the token bucket for one channel"""
+    
+    def __init__(self, tokens):
+        self.jobs = (deque(), deque())  # by priority: (text, future, queued at)
+        self.tokens = tokens
+        self.updated = time.monotonic()
+        self.wakeup = asyncio.Event()
+        self.worker = None
+
+class OutboundQueue:
+    """Per-channel reply scheduler: proactive rate limiting, gameplay first, small messages coalesced"""
+    
+    def __init__(self, burst, window):
+        self.burst = burst
+        self.rate = burst / window
+        self.channels = {}
+        self.enqueued = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.depth_max = 0
+        self.delay_total = 0.0
+        self.delay_max = 0.0
+    
+    def depth(self):
+        return sum(len(jobs) for queue in self.channels.values() for jobs in queue.jobs)
+    
+    def _refill(self, queue):
+        now = time.monotonic()
+        queue.tokens = min(self.burst, queue.tokens + (now - queue.updated) * self.rate)
+        queue.updated = now
+    
+    def note_direct(self, channel_id):
+        """Charge a send that bypassed the queue to the channel's bucket"""
+        queue = self.channels.get(channel_id)
+        if queue is not None:
+            self._refill(queue)
+            queue.tokens -= 1
+    
+    def enqueue(self, channel, text, priority=GAMEPLAY):
+        """Queue a plain text reply; returns a future for the message it ends up in"""
+        future = asyncio.get_running_loop().create_future()
+        queue = self.channels.get(channel.id)
+        if queue is None:
+            queue = self.channels[channel.id] = ChannelQueue(self.burst)
+        queue.jobs[priority].append((text, future, time.monotonic()))
+        self.enqueued += 1
+        self.depth_max = max(self.depth_max, self.depth())
+        queue.wakeup.set()
+        if queue.worker is None:
+            queue.worker = asyncio.create_task(self._drain(channel, queue))
+        return future
+    
+    def _next_batch(self, queue):
+        """Take the oldest job of the highest priority, plus whatever follows it that still fits in one message"""
+        jobs = queue.jobs[GAMEPLAY] or queue.jobs[BULK]
+        batch = [jobs.popleft()]
+        length = len(batch[0][0])
+        while jobs and length + 1 + len(jobs[0][0]) <= MESSAGE_LIMIT:
+            length += 1 + len(jobs[0][0])
+            batch.append(jobs.popleft())
+        return batch
+    
+    async def _drain(self, channel, queue):
+        try:
+            while True:
+                self._refill(queue)
+                if not any(queue.jobs):
+                    # Stay around until the bucket is full again so it isn't forgotten early
+                    if queue.tokens >= self.burst:
+                        break
+                    queue.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(queue.wakeup.wait(), (self.burst - queue.tokens) / self.rate)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if queue.tokens < 1:
+                    await asyncio.sleep((1 - queue.tokens) / self.rate)
+                    continue
+                
+                batch = self._next_batch(queue)
+                queue.tokens -= 1
+                now = time.monotonic()
+                for _, _, queued_at in batch:
+                    self.delay_total += now - queued_at
+                    self.delay_max = max(self.delay_max, now - queued_at)
+                try:
+                    message = await channel.send("\n".join(text for text, _, _ in batch))
+                except Exception as e:
+                    for _, future, _ in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    for _, future, _ in batch:
+                        if not future.done():
+                            future.set_result(message)
+                for _, _, queued_at in batch:
+                    metrics.replies.observe(time.monotonic() - queued_at)
+                self.sent += 1
+                self.coalesced += len(batch) - 1
+        finally:
+            if self.channels.get(channel.id) is queue:
+                del self.channels[channel.id]
+            for jobs in queue.jobs:
+                for _, future, _ in jobs:
+                    if not future.done():
+                        future.cancel()
+
+outbound = OutboundQueue(CHANNEL_BURST, CHANNEL_BURST_WINDOW)
+
+def log_failed_reply(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"❌ Error sending reply: {future.exception()}")
+
+class MythosContext(commands.Context):
+    """Context whose plain text replies go through the outbound queue"""
+    
+    def __init__(self, **attrs):
+        super().__init__(**attrs)
+        self.queued = []  # futures of this context's replies still in the outbound queue
+    
+    async def send(self, content=None, **kwargs):
+        """Send directly, or queue a plain text reply and return a future for its message"""
+        # Interaction responses have their own limits, and views/embeds/files
+        # need their own message, so those go out directly
+        if self.interaction is not None or kwargs or content is None:
+            # ...but still after this command's earlier replies
+            if self.queued:
+                await asyncio.gather(*self.queued, return_exceptions=True)
+            outbound.note_direct(self.channel.id)
+            return await super().send(content, **kwargs)
+        priority = BULK if self.command is not None and self.command.name in BULK_COMMANDS else GAMEPLAY
+        # Queued replies aren't waited for, so a command (and the player locks it
+        # holds) finishes without sitting out a backed-up or rate limited channel
+        future = outbound.enqueue(self.channel, str(content), priority)
+        future.add_done_callback(log_failed_reply)
+        self.queued = [pending for pending in self.queued if not pending.done()]
+        self.queued.append(future)
+        return future
+
+class MythosTree(app_commands.CommandTree):
+    """Slash command tree that scopes commands and autocomplete to the invoking server's players"""
+    
+    async def interaction_check(self, interaction):
+        enter_guild(interaction.guild_id)
+        return True
+
+class MythosBot(commands.AutoShardedBot if SHARDED else commands.Bot):
+    """Bot that owns the persistence lifecycle"""
+    
+    async def get_context(self, origin, *, cls=MythosContext):
+        # Prefix commands run in the task that built their context
+        enter_guild(origin.guild.id if origin.guild else None)
+        return await super().get_context(origin, cls=cls)
+    
+    async def invoke(self, ctx):
+        if ctx.command is None:
+            return await super().invoke(ctx)
+        # Covers checks, lock waits and the command body. Plain text replies only
+        # up to being queued (delivery is metrics.replies); direct sends in full
+        started = time.perf_counter()
+        try:
+            await super().invoke(ctx)
+        finally:
+            metrics.observe_command(ctx.command.qualified_name, time.perf_counter() - started, ctx.command_failed)
+    
+    async def setup_hook(self):
+        global _flush_event, _flush_lock
+        # Load once here; on_ready fires again on every reconnect
+        load_data()
+        _flush_event = asyncio.Event()
+        _flush_lock = asyncio.Lock()
+        self.flush_task = asyncio.create_task(flush_worker())
+        self.session_task = asyncio.create_task(session_worker())
+        self.index_task = asyncio.create_task(card_index.build())
+        self.loop_lag_task = asyncio.create_task(loop_lag_worker())
+        if np is not None:
+            print(f"🎲 $odds simulations use NumPy {np.__version__} ({ODDS_TRIALS} hands per query)")
         else:
-            print("📁 No existing data file found, starting fresh")
-            player_data = {}
-    except Exception as e:
-        print(f"❌ Error loading data: {e}")
-        player_data = {}
+            print(f"⚠️ NumPy not installed: $odds uses the pure-Python fallback ({ODDS_FALLBACK_TRIALS} hands per query)")
+        self.metrics_runner = None
+        if METRICS_PORT:
+            try:
+                self.metrics_runner = await start_metrics_server()
+            except OSError as e:
+                print(f"❌ Error starting metrics endpoint: {e}")
+        
+        if SYNC_SLASH_COMMANDS:
+            try:
+                synced = await self.tree.sync()
+                print(f"✅ Synced {len(synced)} slash commands")
+            except discord.DiscordException as e:
+                print(f"❌ Error syncing slash commands: {e}")
+        
+        # Railway stops containers with SIGTERM; make it close (and flush) cleanly
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(self.close()))
+        except (NotImplementedError, RuntimeError):
+            pass
+    
+    async def close(self):
+        if _flush_lock is not None:
+            await flush_data()
+            await checkpoint_sessions()
+            self.flush_task.cancel()
+            self.session_task.cancel()
+            self.index_task.cancel()
+            self.loop_lag_task.cancel()
+            storage.close()
+            if self.metrics_runner is not None:
+                await self.metrics_runner.cleanup()
+        if _odds_pool is not None:
+            _odds_pool.shutdown(wait=False, cancel_futures=True)
+        await super().close()
 
-def save_data():
-    """Save player data to file"""
-    try:
-        with open(DATA_FILE, 'w') as f:
-            json.dump(player_data, f, indent=2)
-        print("💾 Data saved")
-    except Exception as e:
-        print(f"❌ Error saving data: {e}")
+shard_options = {"shard_count": SHARD_COUNT, "shard_ids": SHARD_IDS} if SHARDED else {}
+bot = MythosBot(command_prefix='$', intents=intents, tree_cls=MythosTree, **shard_options)
 
-def create_default_player():
-    """Create a default player structure"""
-    return {
-        "current_deck": "1",
-        "decks": {
-            "1": {
-                "name": "Deck 1",
-                "cards": BASE_DECK.copy(),
-                "hand_size": 6,
-                "max_mp": 10,
-                "current_mp": 10,
-                "stats": "",
-                "hand": []
-            },
-            "2": {
-                "name": "Deck 2",
-                "cards": [],
-                "hand_size": 6,
-                "max_mp": 10,
-                "current_mp": 10,
-                "stats": "",
-                "hand": []
-            },
-            "3": {
-                "name": "Deck 3",
-                "cards": [],
-                "hand_size": 6,
-                "max_mp": 10,
-                "current_mp": 10,
-                "stats": "",
-                "hand": []
-            },
-            "4": {
-                "name": "Deck 4",
-                "cards": [],
-                "hand_size": 6,
-                "max_mp": 10,
-                "current_mp": 10,
-                "stats": "",
-                "hand": []
-            },
-            "5": {
-                "name": "Deck 5",
-                "cards": [],
-                "hand_size": 6,
-                "max_mp": 10,
-                "current_mp": 10,
-                "stats": "",
-                "hand": []
-            }
-        }
-    }
+# ===== MEMBER RESOLUTION =====
 
-def get_player(user_id):
-    """Get or create player data"""
-    user_id = str(user_id)
-    if user_id not in player_data:
-        player_data[user_id] = create_default_player()
-        save_data()
-        print(f"✅ Created new player: {user_id}")
-    return player_data[user_id]
+MEMBER_PATTERN = re.compile(r"<@!?(\d{15,20})>|(\d{15,20})")
 
-def get_current_deck(user_id):
-    """Get current deck for a user"""
-    player = get_player(user_id)
-    deck_num = player["current_deck"]
+class MemberResolver:
+    """Mention -> member: snowflake parsed directly, guild cache first, API fetch only on a miss"""
     
-    # Ensure the deck exists (for legacy data)
-    if deck_num not in player["decks"]:
-        print(f"⚠️ Deck {deck_num} not found for {user_id}, resetting to deck 1")
-        player["current_deck"] = "1"
-        deck_num = "1"
+    def __init__(self, ttl, max_fetched=1024):
+        self.ttl = ttl
+        self.max_fetched = max_fetched
+        self.fetched = OrderedDict()  # (guild id, user id) -> (member or None, expires at)
+        self.resolved = 0
+        self.cache_hits = 0
+        self.fetch_hits = 0
+        self.fetches = 0
+        self.failures = 0
+        self.time_total = 0.0
+        self.time_max = 0.0
     
-    return player["decks"][deck_num]
+    async def resolve(self, guild, mention):
+        """The guild member a mention or raw id refers to, or None"""
+        match = MEMBER_PATTERN.fullmatch(mention.strip())
+        if guild is None or match is None:
+            self.failures += 1
+            return None
+        started = time.perf_counter()
+        try:
+            member = await self.lookup(guild, int(match.group(1) or match.group(2)))
+        finally:
+            elapsed = time.perf_counter() - started
+            self.resolved += 1
+            self.time_total += elapsed
+            self.time_max = max(self.time_max, elapsed)
+        if member is None:
+            self.failures += 1
+        return member
+    
+    async def lookup(self, guild, user_id):
+        member = guild.get_member(user_id)
+        if member is not None:
+            self.cache_hits += 1
+            return member
+        
+        key = (guild.id, user_id)
+        entry = self.fetched.get(key)
+        now = time.monotonic()
+        if entry is not None and entry[1] > now:
+            self.fetched.move_to_end(key)
+            self.fetch_hits += 1
+            return entry[0]
+        
+        self.fetches += 1
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            member = None
+        except discord.HTTPException:
+            # Don't remember transient errors
+            return None
+        self.fetched[key] = (member, now + self.ttl)
+        self.fetched.move_to_end(key)
+        while len(self.fetched) > self.max_fetched:
+            self.fetched.popitem(last=False)
+        return member
+
+member_resolver = MemberResolver(MEMBER_FETCH_TTL)
+
+async def resolve_member(ctx, mention):
+    """Member for a mention argument, or None if it doesn't name one in this server"""
+    return await member_resolver.resolve(ctx.guild, mention)
+
+class MentionedMember(commands.MemberConverter):
+    """Member argument that resolves mentions and ids through member_resolver, names as before"""
+    
+    async def convert(self, ctx, argument):
+        if MEMBER_PATTERN.fullmatch(argument.strip()) is None:
+            return await super().convert(ctx, argument)
+        member = await resolve_member(ctx, argument)
+        if member is None:
+            raise commands.MemberNotFound(argument)
+        return member
 
 def is_admin(ctx):
     """Check if user is admin"""
@@ -149,16 +2409,56 @@ def parse_mention_at_end(args):
         return args_list[-1], args_list[:-1]
     return None, args_list
 
+def expand_targets(targets):
+    """Members named directly or through a role, without duplicates or bots"""
+    members = {}
+    for target in targets:
+        if target is None:
+            continue
+        for member in target.members if isinstance(target, discord.Role) else [target]:
+            if not member.bot:
+                members.setdefault(member.id, member)
+    return list(members.values())
+
+def is_bulk(targets):
+    """Whether a command was aimed at a role or at several players at once"""
+    return any(isinstance(target, discord.Role) for target in targets) or len([t for t in targets if t is not None]) > 1
+
+async def send_summary(ctx, lines, header):
+    """Send a bulk command's consolidated reply"""
+    pages = paginate(lines, header)
+    if len(pages) > 1:
+        await send_paged(ctx, render_text_page(pages))
+    else:
+        await ctx.send(pages[0])
+
+@bot.before_invoke
+async def lock_players(ctx):
+    """Hold the author's and every mentioned player's (or role member's) lock for the whole command"""
+    user_ids = [ctx.author.id] + [user.id for user in ctx.message.mentions]
+    for role in ctx.message.role_mentions:
+        user_ids.extend(member.id for member in role.members)
+    ctx.player_lock_stripes = await player_locks.acquire(user_ids)
+
+@bot.after_invoke
+async def unlock_players(ctx):
+    stripes = getattr(ctx, "player_lock_stripes", None)
+    if stripes is not None:
+        ctx.player_lock_stripes = None
+        player_locks.release(stripes)
+
 @bot.event
 async def on_ready():
-    load_data()
     print(f'✅ Bot ready: {bot.user}')
     print(f'✅ Servers: {len(bot.guilds)}')
+    if SHARDED:
+        print(f'✅ Shards: {", ".join(map(str, sorted(bot.shards)))} of {bot.shard_count}')
     print(f'✅ Use $helpme for commands')
 
 @bot.event
 async def on_command_error(ctx, error):
     """Global error handler"""
+    metrics.errors[type(error).__name__] += 1
     if isinstance(error, commands.MissingRequiredArgument):
         await ctx.send(f"❌ Missing argument: {error}")
     elif isinstance(error, commands.BadArgument):
@@ -182,7 +2482,7 @@ async def ping(ctx):
 # ===== DECK MANAGEMENT =====
 
 @bot.command()
-async def deck(ctx, action: str, member: Optional[discord.Member] = None):
+async def deck(ctx, action: str, member: Optional[MentionedMember] = None):
     """Switch or reset decks: $deck 2, $deck 3 @player, or $deck reset"""
     try:
         if action.lower() == "reset":
@@ -194,18 +2494,9 @@ async def deck(ctx, action: str, member: Optional[discord.Member] = None):
             
             player = get_player(target.id)
             deck_num = player["current_deck"]
-            deck = player["decks"][deck_num]
             
             # Reset deck to defaults
-            deck["name"] = f"Deck {deck_num}"
-            deck["cards"] = [] if deck_num != "1" else BASE_DECK.copy()
-            deck["hand_size"] = 6
-            deck["max_mp"] = 10
-            deck["current_mp"] = 10
-            deck["stats"] = ""
-            deck["hand"] = []
-            
-            save_data()
+            mutate(target.id, "reset")
             
             if target.id == ctx.author.id:
                 await ctx.send(f"✅ Reset your Deck {deck_num} to default settings")
@@ -232,14 +2523,10 @@ async def deck(ctx, action: str, member: Optional[discord.Member] = None):
         
         player = get_player(target.id)
         old_deck = player["current_deck"]
-        player["current_deck"] = str(deck_num)
         
-        # Reset hand and MP when switching decks
+        # Switching also resets hand and MP
+        mutate(target.id, "switch", str(deck_num))
         current = get_current_deck(target.id)
-        current["hand"] = []
-        current["current_mp"] = current["max_mp"]
-        
-        save_data()
         
         if target.id == ctx.author.id:
             await ctx.send(f"✅ Switched from Deck {old_deck} to Deck {deck_num} ({current['name']})")
@@ -252,7 +2539,7 @@ async def deck(ctx, action: str, member: Optional[discord.Member] = None):
         await ctx.send(f"❌ Error in deck command.")
 
 @bot.command()
-async def decks(ctx, member: Optional[discord.Member] = None):
+async def decks(ctx, member: Optional[MentionedMember] = None):
     """Show list of decks with preview: $decks or $decks @player"""
     try:
         target = member or ctx.author
@@ -261,31 +2548,11 @@ async def decks(ctx, member: Optional[discord.Member] = None):
             await ctx.send("❌ Only admins can view other players' decks!")
             return
         
-        player = get_player(target.id)
-        
-        response = f"**{target.display_name}'s Decks:**\n"
-        
-        for deck_num in range(1, 6):
-            deck = player["decks"][str(deck_num)]
-            current_marker = "✅ " if int(player["current_deck"]) == deck_num else ""
-            response += f"\n{current_marker}**Deck {deck_num}: {deck['name']}** ({len(deck['cards'])} cards)\n"
-            
-            # Show preview of first 3 cards
-            if deck["cards"]:
-                preview = ", ".join([f"`{c[:20]}...`" if len(c) > 20 else f"`{c}`" for c in deck["cards"][:3]])
-                if len(deck["cards"]) > 3:
-                    preview += f" and {len(deck['cards']) - 3} more"
-                response += f"Preview: {preview}\n"
-            else:
-                response += "Preview: *Empty deck*\n"
-        
-        # Handle long messages
-        if len(response) > 2000:
-            parts = [response[i:i+1900] for i in range(0, len(response), 1900)]
-            for i, part in enumerate(parts, 1):
-                await ctx.send(f"**Part {i}:**\n{part}")
+        pages = render_decks(target)
+        if len(pages) > 1:
+            await send_paged(ctx, render_text_page(pages))
         else:
-            await ctx.send(response)
+            await ctx.send(pages[0])
     
     except Exception as e:
         print(f"Error in decks command: {e}")
@@ -306,9 +2573,8 @@ async def name(ctx, *, text: str):
                 await ctx.send("❌ Only admins can set names for other players!")
                 return
             
-            try:
-                member = await commands.MemberConverter().convert(ctx, mention)
-            except:
+            member = await resolve_member(ctx, mention)
+            if member is None:
                 await ctx.send("Invalid user mention!")
                 return
             
@@ -317,9 +2583,7 @@ async def name(ctx, *, text: str):
                 await ctx.send("Please provide a name!")
                 return
             
-            current = get_current_deck(member.id)
-            current["name"] = deck_name
-            save_data()
+            mutate(member.id, "set", "name", deck_name)
             await ctx.send(f"✅ Set {member.display_name}'s current deck name to: {deck_name}")
         
         else:
@@ -328,9 +2592,7 @@ async def name(ctx, *, text: str):
                 await ctx.send("Please provide a name!")
                 return
             
-            current = get_current_deck(ctx.author.id)
-            current["name"] = text
-            save_data()
+            mutate(ctx.author.id, "set", "name", text)
             await ctx.send(f"✅ Set your current deck name to: {text}")
     
     except Exception as e:
@@ -340,7 +2602,7 @@ async def name(ctx, *, text: str):
 # ===== CARD MANAGEMENT =====
 
 @bot.command()
-async def cards(ctx, member: Optional[discord.Member] = None):
+async def cards(ctx, member: Optional[MentionedMember] = None):
     """Show deck cards: $cards or $cards @player"""
     try:
         target = member or ctx.author
@@ -355,23 +2617,14 @@ async def cards(ctx, member: Optional[discord.Member] = None):
             await ctx.send(f"{target.display_name}'s current deck is empty!")
             return
         
-        response = f"**{target.display_name}'s {current['name']}** ({len(current['cards'])} cards):\n"
-        for i, card in enumerate(current["cards"], 1):
-            response += f"{i}. {card}\n"
-        
-        # Handle long messages
-        if len(response) > 2000:
-            await ctx.send(f"**{target.display_name}'s {current['name']}** (Part 1):")
-            part = ""
-            for i, card in enumerate(current["cards"], 1):
-                if len(part) + len(f"{i}. {card}\n") > 1900:
-                    await ctx.send(part)
-                    part = ""
-                part += f"{i}. {card}\n"
-            if part:
-                await ctx.send(part)
-        else:
-            await ctx.send(response)
+        # Big decks get one message with page buttons instead of a flood
+        if len(current["cards"]) > current["page_size"]:
+            deck_num = get_player(target.id)["current_deck"]
+            await send_paged(ctx, lambda page: render_cards_page(target, deck_num, page))
+            return
+        
+        for page in render_cards(target):
+            await ctx.send(page)
     
     except Exception as e:
         print(f"Error in cards command: {e}")
@@ -379,7 +2632,7 @@ async def cards(ctx, member: Optional[discord.Member] = None):
 
 @bot.command()
 async def add(ctx, *, text: str):
-    """Add cards: $add Fire - 3 Mp (one per line for multiple)"""
+    """Add cards: $add 4x Fire - 3 Mp (one per line for multiple)"""
     try:
         # Check if this is a bulk add (contains line breaks)
         if '\n' in text:
@@ -395,7 +2648,11 @@ async def add(ctx, *, text: str):
                 if line.startswith('<@') and line.endswith('>'):
                     mention = line
                 else:
-                    cards_to_add.append(line)
+                    try:
+                        cards_to_add.append(parse_card_quantity(line))
+                    except ValueError as e:
+                        await ctx.send(f"❌ `{line}`: {e}")
+                        return
             
             if not cards_to_add:
                 await ctx.send("No valid cards found to add!")
@@ -407,41 +2664,34 @@ async def add(ctx, *, text: str):
                     await ctx.send("❌ Only admins can add cards to other players!")
                     return
                 
-                try:
-                    member = await commands.MemberConverter().convert(ctx, mention)
-                except:
+                member = await resolve_member(ctx, mention)
+                if member is None:
                     await ctx.send("Invalid user mention!")
                     return
                 
+                mutate(member.id, "add", card_ids(text for _, text in cards_to_add), [count for count, _ in cards_to_add])
                 current = get_current_deck(member.id)
-                added_count = 0
-                for card in cards_to_add:
-                    current["cards"].append(card)
-                    added_count += 1
-                
-                save_data()
+                added_count = sum(count for count, _ in cards_to_add)
                 
-                preview = ", ".join([f"`{c[:20]}...`" if len(c) > 20 else f"`{c}`" for c in cards_to_add[:3]])
-                if added_count > 3:
-                    preview += f" and {added_count - 3} more"
+                entries = [f"{count}x {text}" if count > 1 else text for count, text in cards_to_add[:3]]
+                preview = ", ".join([f"`{c[:20]}...`" if len(c) > 20 else f"`{c}`" for c in entries])
+                if len(cards_to_add) > 3:
+                    preview += f" and {len(cards_to_add) - 3} more"
                 
-                await ctx.send(f"✅ Admin added {added_count} card(s) to {member.display_name}'s deck\n{preview}\nDeck now has {len(current['cards'])} cards.")
+                await ctx.send(f"✅ Admin added {added_count} card(s) to {member.display_name}'s deck\n{preview}\nDeck now has {deck_size(current)} cards.")
                 return
             
             # Adding to self (multiple cards)
+            mutate(ctx.author.id, "add", card_ids(text for _, text in cards_to_add), [count for count, _ in cards_to_add])
             current = get_current_deck(ctx.author.id)
-            added_count = 0
-            for card in cards_to_add:
-                current["cards"].append(card)
-                added_count += 1
+            added_count = sum(count for count, _ in cards_to_add)
             
-            save_data()
+            entries = [f"{count}x {text}" if count > 1 else text for count, text in cards_to_add[:3]]
+            preview = ", ".join([f"`{c[:20]}...`" if len(c) > 20 else f"`{c}`" for c in entries])
+            if len(cards_to_add) > 3:
+                preview += f" and {len(cards_to_add) - 3} more"
             
-            preview = ", ".join([f"`{c[:20]}...`" if len(c) > 20 else f"`{c}`" for c in cards_to_add[:3]])
-            if added_count > 3:
-                preview += f" and {added_count - 3} more"
-            
-            await ctx.send(f"✅ Added {added_count} card(s) to your deck\n{preview}\nDeck now has {len(current['cards'])} cards.")
+            await ctx.send(f"✅ Added {added_count} card(s) to your deck\n{preview}\nDeck now has {deck_size(current)} cards.")
         
         else:
             # Single card add
@@ -454,24 +2704,31 @@ async def add(ctx, *, text: str):
                     await ctx.send("❌ Only admins can add cards to other players!")
                     return
                 
-                try:
-                    member = await commands.MemberConverter().convert(ctx, mention)
-                except:
+                member = await resolve_member(ctx, mention)
+                if member is None:
                     await ctx.send("Invalid user mention!")
                     return
                 
                 card_text = " ".join(card_parts)
+                try:
+                    count, card = parse_card_quantity(card_text)
+                except ValueError as e:
+                    await ctx.send(f"❌ `{card_text}`: {e}")
+                    return
+                mutate(member.id, "add", card_ids([card]), [count])
                 current = get_current_deck(member.id)
-                current["cards"].append(card_text)
-                save_data()
-                await ctx.send(f"✅ Admin added to {member.display_name}'s deck: `{card_text}`\nDeck now has {len(current['cards'])} cards.")
+                await ctx.send(f"✅ Admin added to {member.display_name}'s deck: `{card_text}`\nDeck now has {deck_size(current)} cards.")
             
             else:
                 # Adding to self
+                try:
+                    count, card = parse_card_quantity(text)
+                except ValueError as e:
+                    await ctx.send(f"❌ `{text.strip()}`: {e}")
+                    return
+                mutate(ctx.author.id, "add", card_ids([card]), [count])
                 current = get_current_deck(ctx.author.id)
-                current["cards"].append(text)
-                save_data()
-                await ctx.send(f"✅ Added to your deck: `{text}`\nDeck now has {len(current['cards'])} cards.")
+                await ctx.send(f"✅ Added to your deck: `{text}`\nDeck now has {deck_size(current)} cards.")
     
     except Exception as e:
         print(f"Error in add command: {e}")
@@ -494,9 +2751,8 @@ async def remove(ctx, *args):
                 await ctx.send("❌ Only admins can remove cards from other players!")
                 return
             
-            try:
-                member = await commands.MemberConverter().convert(ctx, mention)
-            except:
+            member = await resolve_member(ctx, mention)
+            if member is None:
                 await ctx.send("Invalid user mention!")
                 return
             
@@ -520,15 +2776,11 @@ async def remove(ctx, *args):
                     await ctx.send(f"Invalid number: {num}")
                     return
             
-            # Remove in reverse order
-            removed = []
-            for idx in sorted(indices, reverse=True):
-                removed.append(current["cards"].pop(idx - 1))
-            
-            save_data()
+            removed = mutate(member.id, "remove", indices)
+            current = get_current_deck(member.id)
             
-            removed_list = ", ".join([f"`{c}`" for c in reversed(removed)])
-            await ctx.send(f"✅ Admin removed from {member.display_name}'s deck: {removed_list}\nDeck now has {len(current['cards'])} cards.")
+            removed_list = ", ".join([f"`{c}`" for c in card_texts(removed)])
+            await ctx.send(f"✅ Admin removed from {member.display_name}'s deck: {removed_list}\nDeck now has {deck_size(current)} cards.")
         
         else:
             # Removing from self
@@ -553,22 +2805,18 @@ async def remove(ctx, *args):
                     await ctx.send(f"Invalid number: {num}")
                     return
             
-            # Remove in reverse order
-            removed = []
-            for idx in sorted(indices, reverse=True):
-                removed.append(current["cards"].pop(idx - 1))
-            
-            save_data()
+            removed = mutate(ctx.author.id, "remove", indices)
+            current = get_current_deck(ctx.author.id)
             
-            removed_list = ", ".join([f"`{c}`" for c in reversed(removed)])
-            await ctx.send(f"✅ Removed: {removed_list}\nDeck now has {len(current['cards'])} cards.")
+            removed_list = ", ".join([f"`{c}`" for c in card_texts(removed)])
+            await ctx.send(f"✅ Removed: {removed_list}\nDeck now has {deck_size(current)} cards.")
     
     except Exception as e:
         print(f"Error in remove command: {e}")
         await ctx.send(f"❌ Error in remove command.")
 
 @bot.command()
-async def clear(ctx, member: Optional[discord.Member] = None):
+async def clear(ctx, member: Optional[MentionedMember] = None):
     """Clear current deck: $clear or $clear @player"""
     try:
         target = member or ctx.author
@@ -577,9 +2825,8 @@ async def clear(ctx, member: Optional[discord.Member] = None):
             await ctx.send("❌ Only admins can clear other players' decks!")
             return
         
+        mutate(target.id, "clear")
         current = get_current_deck(target.id)
-        current["cards"] = []
-        save_data()
         
         if target.id == ctx.author.id:
             await ctx.send(f"✅ Cleared your current deck ({current['name']})")
@@ -591,7 +2838,7 @@ async def clear(ctx, member: Optional[discord.Member] = None):
         await ctx.send(f"❌ Error in clear command.")
 
 @bot.command()
-async def default(ctx, member: Optional[discord.Member] = None):
+async def default(ctx, member: Optional[MentionedMember] = None):
     """Reset to base deck: $default or $default @player"""
     try:
         target = member or ctx.author
@@ -600,9 +2847,8 @@ async def default(ctx, member: Optional[discord.Member] = None):
             await ctx.send("❌ Only admins can reset other players' decks!")
             return
         
+        mutate(target.id, "default")
         current = get_current_deck(target.id)
-        current["cards"] = BASE_DECK.copy()
-        save_data()
         
         if target.id == ctx.author.id:
             await ctx.send(f"✅ Reset your current deck ({current['name']}) to base deck ({len(BASE_DECK)} cards)")
@@ -613,34 +2859,250 @@ async def default(ctx, member: Optional[discord.Member] = None):
         print(f"Error in default command: {e}")
         await ctx.send(f"❌ Error in default command.")
 
-# ===== GAME PLAY =====
+# ===== IMPORT / EXPORT =====
+
+# Deck files are parsed line by line on a worker thread and then applied as a
+# single add; every format round-trips with $export:
+#   .txt  - one card per line, "4x " for copies, "#" starts a comment
+#   .csv  - count,card rows (header optional)
+#   .json - {"name": ..., "cards": [{"card": ..., "count": ...}]} or a plain list
+
+MAX_CARD_LENGTH = 200
+MAX_IMPORT_ERRORS = 5
+EXPORT_FORMATS = ("txt", "csv", "json")
+CSV_HEADERS = {"count", "quantity", "qty", "card", "name"}
+FILENAME_UNSAFE = re.compile(r"[^\w-]+")
+
+def import_entry(count, card):
+    """Validate one (count, card text) pair from a deck file, raising ValueError with the reason"""
+    card = card.strip()
+    if not card:
+        raise ValueError("no card text")
+    if len(card) > MAX_CARD_LENGTH:
+        raise ValueError(f"card text longer than {MAX_CARD_LENGTH} characters")
+    return check_quantity(count), card
+
+def parse_text_row(line):
+    match = QUANTITY_PATTERN.match(line)
+    if match:
+        return import_entry(int(match.group(1)), match.group(2))
+    return import_entry(1, line)
+
+def parse_csv_row(cells):
+    if len(cells) == 1:
+        return parse_text_row(cells[0])
+    if len(cells) == 2 and cells[0].isdigit() != cells[1].isdigit():
+        count, card = cells if cells[0].isdigit() else reversed(cells)
+        return import_entry(int(count), card)
+    if {cell.lower() for cell in cells} <= CSV_HEADERS:
+        return None
+    raise ValueError("expected a count and a card")
+
+def parse_json_item(item):
+    if isinstance(item, str):
+        return parse_text_row(item)
+    if not isinstance(item, dict):
+        raise ValueError("expected a card")
+    count = item.get("count", item.get("quantity", 1))
+    if not isinstance(count, int):
+        raise ValueError("count must be a number")
+    return import_entry(count, str(item.get("card", item.get("name", ""))))
+
+def text_rows(stream):
+    for line_num, line in enumerate(stream, 1):
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield f"line {line_num}", line
+
+def csv_rows(stream):
+    reader = csv.reader(stream)
+    for row in reader:
+        cells = [cell.strip() for cell in row if cell.strip()]
+        if cells and not cells[0].startswith("#"):
+            yield f"line {reader.line_num}", cells
+
+def json_rows(stream):
+    data = json.load(stream)
+    if isinstance(data, dict):
+        data = data.get("cards")
+    if not isinstance(data, list):
+        raise ValueError("expected a list of cards")
+    for num, item in enumerate(data, 1):
+        yield f"card {num}", item
+
+DECK_FILE_FORMATS = {
+    ".csv": (csv_rows, parse_csv_row),
+    ".json": (json_rows, parse_json_item),
+}
+
+def parse_deck_file(data, filename):
+    """Parse an uploaded deck file (worker thread): returns ({card: count} in file order, first errors, bad row count)"""
+    rows, parse_row = DECK_FILE_FORMATS.get(os.path.splitext(filename.lower())[1], (text_rows, parse_text_row))
+    stream = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", newline="")
+    entries, errors, bad = {}, [], 0
+    for location, row in rows(stream):
+        try:
+            entry = parse_row(row)
+        except ValueError as e:
+            bad += 1
+            if len(errors) < MAX_IMPORT_ERRORS:
+                errors.append(f"{location}: {e}")
+            continue
+        if entry is not None:
+            count, card = entry
+            entries[card] = entries.get(card, 0) + count
+    return entries, errors, bad
+
+def export_deck_file(fmt, name, entries):
+    """Write (count, card text) entries as a deck file (worker thread)"""
+    out = io.StringIO()
+    if fmt == "json":
+        json.dump({"name": name, "cards": [{"card": card, "count": count} for count, card in entries]}, out, indent=1, ensure_ascii=False)
+    elif fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(["count", "card"])
+        writer.writerows(entries)
+    else:
+        out.write(f"# {name}\n")
+        for count, card in entries:
+            out.write(f"{count}x {card}\n" if count > 1 else f"{card}\n")
+    return io.BytesIO(out.getvalue().encode("utf-8"))
+
+@bot.command(name="import")
+async def import_cards(ctx, *args):
+    """Add cards from an attached .txt/.csv/.json file: $import, $import replace, $import @player (admin)"""
+    try:
+        mention, options = parse_mention_at_end(args)
+        
+        if mention:
+            if not is_admin(ctx):
+                await ctx.send("❌ Only admins can import cards for other players!")
+                return
+            
+            target = await resolve_member(ctx, mention)
+            if target is None:
+                await ctx.send("Invalid user mention!")
+                return
+        else:
+            target = ctx.author
+        
+        replace = [option.lower() for option in options] == ["replace"]
+        if options and not replace:
+            await ctx.send("Use: `$import` or `$import replace` with a deck file attached")
+            return
+        
+        if not ctx.message.attachments:
+            await ctx.send("📎 Attach a .txt, .csv or .json deck file to `$import`!")
+            return
+        
+        attachment = ctx.message.attachments[0]
+        if attachment.size > IMPORT_MAX_BYTES:
+            await ctx.send(f"❌ `{attachment.filename}` is too big! (Max {IMPORT_MAX_BYTES // 1024} KB)")
+            return
+        
+        # Parsing runs off the event loop; only the final add touches the deck
+        data = await attachment.read()
+        try:
+            entries, errors, bad = await asyncio.get_running_loop().run_in_executor(None, parse_deck_file, data, attachment.filename)
+        except ValueError as e:
+            await ctx.send(f"❌ Couldn't read `{attachment.filename}`: {e}")
+            return
+        
+        if not entries:
+            await ctx.send(f"No valid cards found in `{attachment.filename}`!")
+            return
+        
+        if replace:
+            mutate(target.id, "clear")
+        mutate(target.id, "add", card_ids(entries), list(entries.values()))
+        current = get_current_deck(target.id)
+        
+        owner = "your" if target == ctx.author else f"{target.display_name}'s"
+        response = f"✅ Imported {sum(entries.values())} card(s) ({len(entries)} entries) from `{attachment.filename}` into {owner} {current['name']}\n"
+        response += f"Deck now has {deck_size(current)} cards."
+        if bad:
+            response += f"\n⚠️ Skipped {bad} invalid row(s):\n" + "\n".join(f"• {error}" for error in errors)
+            if bad > len(errors):
+                response += f"\n• ...and {bad - len(errors)} more"
+        await ctx.send(response)
+    
+    except Exception as e:
+        print(f"Error in import command: {e}")
+        traceback.print_exc()
+        await ctx.send(f"❌ Error in import command.")
 
 @bot.command()
-async def draw(ctx, member: Optional[discord.Member] = None):
-    """Draw a hand: $draw or $draw @player (admin only for others)"""
+async def export(ctx, *args):
+    """Download the current deck as a file: $export, $export csv, $export json, $export @player (admin)"""
     try:
-        target = member or ctx.author
+        mention, options = parse_mention_at_end(args)
         
-        if member and not is_admin(ctx):
-            await ctx.send("❌ Only admins can draw for other players!")
+        if mention:
+            if not is_admin(ctx):
+                await ctx.send("❌ Only admins can export other players' decks!")
+                return
+            
+            target = await resolve_member(ctx, mention)
+            if target is None:
+                await ctx.send("Invalid user mention!")
+                return
+        else:
+            target = ctx.author
+        
+        fmt = options[0].lower() if options else "txt"
+        if len(options) > 1 or fmt not in EXPORT_FORMATS:
+            await ctx.send("Use: `$export`, `$export csv` or `$export json`")
             return
         
         current = get_current_deck(target.id)
+        if not current["cards"]:
+            await ctx.send(f"{target.display_name}'s current deck is empty!")
+            return
+        
+        entries = list(zip(current["counts"], card_texts(current["cards"])))
+        fp = await asyncio.get_running_loop().run_in_executor(None, export_deck_file, fmt, current["name"], entries)
+        filename = f"{FILENAME_UNSAFE.sub('_', current['name']).strip('_') or 'deck'}.{fmt}"
+        await ctx.send(f"📤 {target.display_name}'s {current['name']} ({deck_size(current)} cards)", file=discord.File(fp, filename=filename))
+    
+    except Exception as e:
+        print(f"Error in export command: {e}")
+        traceback.print_exc()
+        await ctx.send(f"❌ Error in export command.")
+
+# ===== GAME PLAY =====
+
+@bot.command()
+async def draw(ctx, *targets: Union[MentionedMember, discord.Role]):
+    """Draw a hand: $draw, $draw @player or $draw @Party (admin only for others)"""
+    try:
+        members = expand_targets(targets)
+        member = members[0] if members else None
+        target = member or ctx.author
         
-        if len(current["cards"]) < current["hand_size"]:
-            await ctx.send(f"❌ {target.display_name} needs at least {current['hand_size']} cards in their deck! (Has {len(current['cards'])})")
+        if (member or is_bulk(targets)) and not is_admin(ctx):
+            await ctx.send("❌ Only admins can draw for other players!")
             return
         
-        # Draw hand
-        current["hand"] = random.sample(current["cards"], current["hand_size"])
-        save_data()
+        if is_bulk(targets):
+            lines = []
+            for member in members:
+                if deal_hand(member.id):
+                    current = get_current_deck(member.id)
+                    hand_list = ", ".join(f"`{card}`" for card in card_texts(current["hand"]))
+                    lines.append(f"**{member.display_name}** ({current['name']}, MP {current['current_mp']}/{current['max_mp']}): {hand_list}")
+                else:
+                    lines.append(f"❌ **{member.display_name}** doesn't have enough cards in their deck")
+            await send_summary(ctx, lines, f"🎴 Drew hands for {len(members)} player(s)\n")
+            return
         
-        # Show hand with MP
-        response = f"**{target.display_name}'s {current['name']}** - MP: {current['current_mp']}/{current['max_mp']}\n"
-        for i, card in enumerate(current["hand"], 1):
-            response += f"{i}. {card}\n"
+        if not deal_hand(target.id):
+            current = get_current_deck(target.id)
+            await ctx.send(f"❌ {target.display_name} needs at least {current['hand_size']} cards in their deck! (Has {deck_size(current)})")
+            return
         
-        await ctx.send(response)
+        # Show hand with MP, plus buttons to play it without more commands
+        view = HandView(target)
+        view.message = await ctx.send(render_hand(target), view=view)
     
     except Exception as e:
         print(f"Error in draw command: {e}")
@@ -662,9 +3124,8 @@ async def x(ctx, *args):
                 await ctx.send("❌ Only admins can replace cards for other players!")
                 return
             
-            try:
-                member = await commands.MemberConverter().convert(ctx, mention)
-            except:
+            member = await resolve_member(ctx, mention)
+            if member is None:
                 await ctx.send("Invalid user mention!")
                 return
             
@@ -683,33 +3144,18 @@ async def x(ctx, *args):
             await ctx.send("Specify cards to replace!")
             return
         
-        hand = current["hand"].copy()
-        replaced = []
-        
         try:
-            for num in card_numbers:
-                idx = int(num) - 1
-                if 0 <= idx < current["hand_size"]:
-                    # Replace with random card from deck
-                    available = [c for c in current["cards"] if c not in hand]
-                    if available:
-                        hand[idx] = random.choice(available)
-                    else:
-                        hand[idx] = random.choice(current["cards"])
-                    replaced.append(int(num))
+            replaced, skipped = replace_from_pile(target.id, [int(num) for num in card_numbers])
             
-            current["hand"] = hand
-            save_data()
-            
-            replaced_list = ", ".join(map(str, sorted(replaced)))
+            replaced_list = ", ".join(map(str, sorted(replaced))) or "none"
             
             if mention:
-                response = f"**{target.display_name}'s {current['name']}** - MP: {current['current_mp']}/{current['max_mp']} (Admin replaced {replaced_list})\n"
+                response = render_hand(target, f" (Admin replaced {replaced_list})")
             else:
-                response = f"**{target.display_name}'s {current['name']}** - MP: {current['current_mp']}/{current['max_mp']} (replaced {replaced_list})\n"
+                response = render_hand(target, f" (replaced {replaced_list})")
             
-            for i, card in enumerate(hand, 1):
-                response += f"{i}. {card}\n"
+            if skipped:
+                response += f"⚠️ Draw pile is empty, kept {', '.join(map(str, skipped))}"
             
             await ctx.send(response)
         except ValueError:
@@ -720,7 +3166,7 @@ async def x(ctx, *args):
         await ctx.send(f"❌ Error in x command.")
 
 @bot.command()
-async def hand(ctx, member: Optional[discord.Member] = None):
+async def hand(ctx, member: Optional[MentionedMember] = None):
     """Show current hand: $hand or $hand @player"""
     try:
         target = member or ctx.author
@@ -731,42 +3177,148 @@ async def hand(ctx, member: Optional[discord.Member] = None):
         
         current = get_current_deck(target.id)
         
-        if not current["hand"]:
-            await ctx.send(f"{target.display_name} hasn't drawn a hand yet!")
+        if not current["hand"]:
+            await ctx.send(f"{target.display_name} hasn't drawn a hand yet!")
+            return
+        
+        await ctx.send(render_hand(target))
+    
+    except Exception as e:
+        print(f"Error in hand command: {e}")
+        await ctx.send(f"❌ Error in hand command.")
+
+@bot.command()
+async def shuffle(ctx, member: Optional[MentionedMember] = None):
+    """Shuffle the discard pile back into the draw pile: $shuffle or $shuffle @player"""
+    try:
+        target = member or ctx.author
+        
+        if member and not is_admin(ctx):
+            await ctx.send("❌ Only admins can shuffle other players' piles!")
+            return
+        
+        current, pile = get_pile(target.id)
+        
+        if not current["discard"]:
+            await ctx.send(f"{target.display_name}'s discard pile is empty!")
+            return
+        
+        returned = len(current["discard"])
+        pile.restore(current["discard"])
+        mutate(target.id, "reshuffle")
+        
+        await ctx.send(f"🔀 Shuffled {returned} card(s) back into {target.display_name}'s draw pile ({pile.left} cards)")
+    
+    except Exception as e:
+        print(f"Error in shuffle command: {e}")
+        await ctx.send(f"❌ Error in shuffle command.")
+
+@bot.command()
+async def pile(ctx, member: Optional[MentionedMember] = None):
+    """Show draw pile, hand and discard counts: $pile or $pile @player"""
+    try:
+        target = member or ctx.author
+        
+        if member and not is_admin(ctx):
+            await ctx.send("❌ Only admins can view other players' piles!")
+            return
+        
+        current, draw_pile = get_pile(target.id)
+        
+        response = f"**{target.display_name}'s {current['name']}** ({deck_size(current)} cards)\n"
+        response += f"• Draw Pile: {draw_pile.left}\n"
+        response += f"• Hand: {len(current['hand'])}\n"
+        response += f"• Discard: {len(current['discard'])}\n"
+        response += f"• Reshuffle Discards: {'on' if current['reshuffle'] else 'off'}"
+        
+        await ctx.send(response)
+    
+    except Exception as e:
+        print(f"Error in pile command: {e}")
+        await ctx.send(f"❌ Error in pile command.")
+
+@bot.command()
+async def discard(ctx, *args):
+    """Show the discard pile or discard from hand: $discard, $discard 2 4 or $discard @player"""
+    try:
+        mention, card_numbers = parse_mention_at_end(args)
+        
+        if mention:
+            if not is_admin(ctx):
+                await ctx.send("❌ Only admins can manage other players' discard piles!")
+                return
+            
+            member = await resolve_member(ctx, mention)
+            if member is None:
+                await ctx.send("Invalid user mention!")
+                return
+            
+            target = member
+        else:
+            target = ctx.author
+            card_numbers = list(args)
+        
+        current = get_current_deck(target.id)
+        
+        if card_numbers:
+            try:
+                indices = [int(num) - 1 for num in card_numbers]
+            except ValueError:
+                await ctx.send("Use hand numbers: `$discard 2 4`")
+                return
+            
+            if not all(0 <= idx < len(current["hand"]) for idx in indices):
+                await ctx.send(f"Use numbers 1-{len(current['hand'])}: `$discard 2 4`")
+                return
+            
+            mutate(target.id, "discard", indices)
+            current = get_current_deck(target.id)
+        
+        if not current["discard"]:
+            await ctx.send(f"{target.display_name}'s discard pile is empty!")
             return
         
-        response = f"**{target.display_name}'s {current['name']}** - MP: {current['current_mp']}/{current['max_mp']}\n"
-        for i, card in enumerate(current["hand"], 1):
-            response += f"{i}. {card}\n"
+        header = f"**{target.display_name}'s {current['name']}** - Discard ({len(current['discard'])} cards):\n"
+        lines = numbered(card_texts(current["discard"]))
         
-        await ctx.send(response)
+        # Same rule as $cards: more than a page of cards gets one message with page buttons
+        size = current["page_size"]
+        if len(lines) > size:
+            pages = [
+                (header + "\n".join(lines[start:start + size]))[:EMBED_DESCRIPTION_LIMIT]
+                for start in range(0, len(lines), size)
+            ]
+            await send_paged(ctx, render_text_page(pages))
+            return
+        
+        for page in paginate(lines, header):
+            await ctx.send(page)
     
     except Exception as e:
-        print(f"Error in hand command: {e}")
-        await ctx.send(f"❌ Error in hand command.")
+        print(f"Error in discard command: {e}")
+        await ctx.send(f"❌ Error in discard command.")
 
 # ===== MP MANAGEMENT =====
 
 @bot.command()
-async def mp(ctx, operation: str, member: Optional[discord.Member] = None):
-    """Manage MP: $mp +2, $mp -3, $mp max, or $mp max @player (MP can go negative)"""
+async def mp(ctx, operation: str, *targets: Union[MentionedMember, discord.Role]):
+    """Manage MP: $mp +2, $mp -3, $mp max, $mp max @player or $mp max @Party (MP can go negative)"""
     try:
+        members = expand_targets(targets)
+        member = members[0] if members else None
         target = member or ctx.author
         
-        if member and not is_admin(ctx):
+        if (member or is_bulk(targets)) and not is_admin(ctx):
             await ctx.send("❌ Only admins can modify other players' MP!")
             return
         
-        current = get_current_deck(target.id)
-        
         # Handle max reset
         if operation.lower() == "max":
-            current["current_mp"] = current["max_mp"]
+            change = None
             action = "reset to max"
         elif operation.startswith("+") or operation.startswith("-"):
             try:
                 change = int(operation)
-                current["current_mp"] += change
                 action = f"{operation} MP"
             except ValueError:
                 await ctx.send("Use: `$mp +2`, `$mp -3`, or `$mp max`")
@@ -775,13 +3327,23 @@ async def mp(ctx, operation: str, member: Optional[discord.Member] = None):
             await ctx.send("Use: `$mp +2`, `$mp -3`, or `$mp max`")
             return
         
-        save_data()
+        if is_bulk(targets):
+            lines = []
+            for member in members:
+                current = get_current_deck(member.id)
+                mutate(member.id, "mp", current["max_mp"] - current["current_mp"] if change is None else change)
+                current = get_current_deck(member.id)
+                lines.append(f"• {member.display_name} - MP: {current['current_mp']}/{current['max_mp']}")
+            await send_summary(ctx, lines, f"✅ MP {action} for {len(members)} player(s):\n")
+            return
+        
+        current = get_current_deck(target.id)
+        mutate(target.id, "mp", current["max_mp"] - current["current_mp"] if change is None else change)
+        current = get_current_deck(target.id)
         
         # Show hand with updated MP
         if current["hand"]:
-            response = f"**{target.display_name}'s {current['name']}** - MP: {current['current_mp']}/{current['max_mp']} ({action})\n"
-            for i, card in enumerate(current["hand"], 1):
-                response += f"{i}. {card}\n"
+            response = render_hand(target, f" ({action})")
         else:
             response = f"**{target.display_name}'s {current['name']}** - MP: {current['current_mp']}/{current['max_mp']} ({action})\nNo hand drawn yet."
         
@@ -791,11 +3353,74 @@ async def mp(ctx, operation: str, member: Optional[discord.Member] = None):
         print(f"Error in mp command: {e}")
         await ctx.send(f"❌ Error in mp command.")
 
+@bot.command()
+async def curve(ctx, member: Optional[MentionedMember] = None):
+    """Show the current deck's MP curve: $curve or $curve @player"""
+    try:
+        target = member or ctx.author
+        
+        if member and not is_admin(ctx):
+            await ctx.send("❌ Only admins can view other players' decks!")
+            return
+        
+        current, costs = get_cost_curve(target.id)
+        
+        if not current["cards"]:
+            await ctx.send(f"{target.display_name}'s current deck is empty!")
+            return
+        
+        costed = sum(count for cost, count in costs.items() if cost is not None)
+        average = sum(cost * count for cost, count in costs.items() if cost is not None) / costed if costed else 0
+        widest = max(costs.values())
+        response = f"**{target.display_name}'s {current['name']}** - MP curve ({deck_size(current)} cards, avg {average:.1f} MP)\n"
+        for cost in sorted(cost for cost in costs if cost is not None):
+            bar = "█" * max(1, round(20 * costs[cost] / widest))
+            response += f"`{cost:>2} MP` {bar} {costs[cost]}\n"
+        if costs[None]:
+            response += f"No MP cost: {costs[None]} card(s)\n"
+        await ctx.send(response)
+    
+    except Exception as e:
+        print(f"Error in curve command: {e}")
+        await ctx.send(f"❌ Error in curve command.")
+
 # ===== SETTINGS =====
 
+# setting name -> (op and field to mutate, label, min, max)
+NUMERIC_SETTINGS = {
+    "hand": (("set", "hand_size"), "hand size", 1, 20),
+    "mp": (("max_mp",), "max MP", 1, 100),
+    "page": (("set", "page_size"), "cards per page", 5, 50),
+}
+
+# setting name -> (deck field, label, reply name) for on/off settings
+TOGGLE_SETTINGS = {
+    "reshuffle": ("reshuffle", "discard reshuffle", "Reshuffle"),
+    "costs": ("cost_flags", "unaffordable card flags", "Costs"),
+}
+
+def parse_setting(setting, value):
+    """Validate `$settings <setting> <value>`: returns (mutate args, label, shown value), raises ValueError with the reply"""
+    setting = setting.lower()
+    if setting in TOGGLE_SETTINGS:
+        field, label, name = TOGGLE_SETTINGS[setting]
+        if value.lower() not in ("on", "off"):
+            raise ValueError(f"{name} must be `on` or `off`!")
+        return ("set", field, value.lower() == "on"), label, value.lower()
+    if setting not in NUMERIC_SETTINGS:
+        raise ValueError("Invalid setting! Use `hand`, `mp`, `page`, `reshuffle` or `costs`")
+    op_args, label, low, high = NUMERIC_SETTINGS[setting]
+    try:
+        new_value = int(value)
+    except ValueError:
+        raise ValueError("Value must be a number!")
+    if new_value < low or new_value > high:
+        raise ValueError(f"{label[0].upper() + label[1:]} must be between {low} and {high}!")
+    return op_args + (new_value,), label, new_value
+
 @bot.command()
-async def settings(ctx, setting: Optional[str] = None, value: Optional[str] = None, member: Optional[discord.Member] = None):
-    """View or change settings: $settings, $settings hand 8, $settings mp 15 @player"""
+async def settings(ctx, setting: Optional[str] = None, value: Optional[str] = None, *targets: Union[MentionedMember, discord.Role]):
+    """View or change settings: $settings, $settings hand 8, $settings mp 15 @player, $settings hand 8 @Party"""
     try:
         # Just view settings
         if setting is None:
@@ -804,16 +3429,21 @@ async def settings(ctx, setting: Optional[str] = None, value: Optional[str] = No
             response += f"• Hand Size: {current['hand_size']}\n"
             response += f"• Max MP: {current['max_mp']}\n"
             response += f"• Current MP: {current['current_mp']}/{current['max_mp']}\n"
-            response += f"• Cards in Deck: {len(current['cards'])}\n"
+            response += f"• Cards in Deck: {deck_size(current)}\n"
+            response += f"• Reshuffle Discards: {'on' if current['reshuffle'] else 'off'}\n"
+            response += f"• Flag Unaffordable Cards: {'on' if current['cost_flags'] else 'off'}\n"
+            response += f"• Cards per Page: {current['page_size']}\n"
             if current["stats"]:
                 response += f"• Stats: {current['stats']}"
             await ctx.send(response)
             return
         
         # Changing settings
+        members = expand_targets(targets)
+        member = members[0] if members else None
         target = member or ctx.author
         
-        if member and not is_admin(ctx):
+        if (member or is_bulk(targets)) and not is_admin(ctx):
             await ctx.send("❌ Only admins can change settings for other players!")
             return
         
@@ -821,33 +3451,22 @@ async def settings(ctx, setting: Optional[str] = None, value: Optional[str] = No
             await ctx.send(f"Specify a value: `$settings {setting} 8`")
             return
         
-        current = get_current_deck(target.id)
-        
         try:
-            if setting.lower() == "hand":
-                new_value = int(value)
-                if new_value < 1 or new_value > 20:
-                    await ctx.send("Hand size must be between 1 and 20!")
-                    return
-                current["hand_size"] = new_value
-                save_data()
-                await ctx.send(f"✅ Set {target.display_name}'s hand size to {new_value}")
-                
-            elif setting.lower() == "mp":
-                new_value = int(value)
-                if new_value < 1 or new_value > 100:
-                    await ctx.send("Max MP must be between 1 and 100!")
-                    return
-                current["max_mp"] = new_value
-                current["current_mp"] = new_value
-                save_data()
-                await ctx.send(f"✅ Set {target.display_name}'s max MP to {new_value}")
-                
-            else:
-                await ctx.send("Invalid setting! Use `hand` or `mp`")
-                
-        except ValueError:
-            await ctx.send("Value must be a number!")
+            op_args, label, shown = parse_setting(setting, value)
+        except ValueError as e:
+            await ctx.send(str(e))
+            return
+        
+        if is_bulk(targets):
+            lines = []
+            for member in members:
+                mutate(member.id, *op_args)
+                lines.append(f"• {member.display_name}")
+            await send_summary(ctx, lines, f"✅ Set {label} to {shown} for {len(members)} player(s):\n")
+            return
+        
+        mutate(target.id, *op_args)
+        await ctx.send(f"✅ Set {target.display_name}'s {label} to {shown}")
     
     except Exception as e:
         print(f"Error in settings command: {e}")
@@ -877,9 +3496,8 @@ async def stats(ctx, *, text: Optional[str] = None):
                 await ctx.send("❌ Only admins can set stats for other players!")
                 return
             
-            try:
-                member = await commands.MemberConverter().convert(ctx, mention)
-            except:
+            member = await resolve_member(ctx, mention)
+            if member is None:
                 await ctx.send("Invalid user mention!")
                 return
             
@@ -888,9 +3506,8 @@ async def stats(ctx, *, text: Optional[str] = None):
                 await ctx.send("Please provide stats text!")
                 return
             
+            mutate(member.id, "set", "stats", stat_text)
             current = get_current_deck(member.id)
-            current["stats"] = stat_text
-            save_data()
             await ctx.send(f"✅ Set stats for {member.display_name}'s {current['name']}")
         
         else:
@@ -899,53 +3516,799 @@ async def stats(ctx, *, text: Optional[str] = None):
                 await ctx.send("Please provide stats text!")
                 return
             
+            mutate(ctx.author.id, "set", "stats", text)
             current = get_current_deck(ctx.author.id)
-            current["stats"] = text
-            save_data()
             await ctx.send(f"✅ Set stats for your {current['name']}")
     
     except Exception as e:
         print(f"Error in stats command: {e}")
         await ctx.send(f"❌ Error in stats command.")
 
+# ===== ODDS =====
+
+# $odds reduces the deck to a composition (copies of each wanted card group
+# plus everything else), which is all the odds depend on. Opening-hand odds
+# come from the exact multivariate hypergeometric; the odds after replacing
+# every unwanted card once with $x are simulated in a process pool, as
+# batched urn draws with NumPy when it is installed
+
+ODDS_TERMS_MAX = 5
+
+def exact_opening_odds(groups, others, hand_size, needs):
+    """Chance that a hand holds at least needs[g] copies of every group g"""
+    memo = {}
+    
+    def ways(g, left):
+        # Hands of `left` cards over groups g.. and the other cards meeting the needs
+        if g == len(groups):
+            return math.comb(others, left)
+        if (g, left) not in memo:
+            memo[g, left] = sum(
+                math.comb(groups[g], taken) * ways(g + 1, left - taken)
+                for taken in range(needs[g], min(groups[g], left) + 1)
+            )
+        return memo[g, left]
+    
+    return ways(0, hand_size) / math.comb(sum(groups) + others, hand_size)
+
+def simulate_odds(groups, others, hand_size, needs, trials, seed):
+    """Monte Carlo (worker process): (opening successes, successes after one replace) over trials hands"""
+    # Label 0 is any other card, label g + 1 is group g; only the first
+    # hand_size cards plus up to hand_size replacements are ever drawn
+    sizes = [others] + list(groups)
+    depth = min(2 * hand_size, sum(sizes))
+    if np is None:
+        rng = random.Random(seed)
+        population = [label for label, size in enumerate(sizes) for _ in range(size)]
+        opening = replaced = 0
+        for _ in range(trials):
+            drawn = rng.sample(population, depth)
+            kept = [min(drawn[:hand_size].count(g + 1), need) for g, need in enumerate(needs)]
+            opening += all(drawn[:hand_size].count(g + 1) >= need for g, need in enumerate(needs))
+            redraw = drawn[hand_size:depth][:hand_size - sum(kept)]
+            replaced += all(kept[g] + redraw.count(g + 1) >= need for g, need in enumerate(needs))
+        return opening, replaced
+    
+    rng = np.random.default_rng(seed)
+    need = np.array(needs)
+    rows = np.arange(trials)
+    # Draw without replacement as an urn: each step picks a label in proportion
+    # to the copies left, so the cost doesn't depend on the deck size
+    remaining = np.tile(np.array(sizes), (trials, 1))
+    drawn = np.empty((trials, depth), dtype=np.int64)
+    for step in range(depth):
+        pick = rng.random(trials) * remaining.sum(axis=1)
+        label = (remaining.cumsum(axis=1) <= pick[:, None]).sum(axis=1)
+        drawn[:, step] = label
+        remaining[rows, label] -= 1
+    
+    labels = np.arange(1, len(groups) + 1)
+    in_hand = (drawn[:, :hand_size, None] == labels).sum(axis=1)
+    kept = np.minimum(in_hand, need)
+    # Everything not kept is replaced by the next cards of the pile
+    window = np.arange(hand_size, depth)[None, :] < (2 * hand_size - kept.sum(axis=1))[:, None]
+    redrawn = ((drawn[:, hand_size:, None] == labels) & window[:, :, None]).sum(axis=1)
+    return int((in_hand >= need).all(axis=1).sum()), int((kept + redrawn >= need).all(axis=1).sum())
+
+_odds_pool = None
+
+def odds_pool():
+    """Worker processes for simulations, started on first use"""
+    global _odds_pool
+    if _odds_pool is None:
+        # spawn: forking a process that runs threads and an event loop isn't safe
+        _odds_pool = ProcessPoolExecutor(ODDS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _odds_pool
+
+odds_cache = RenderCache(ODDS_CACHE_SIZE)
+
+def odds_groups(deck, text):
+    """Resolve "$odds" terms to (label, deck entry positions, copies needed); raises ValueError with the reply"""
+    # Commas or a leading "2x" mean full card names; otherwise each word is its own term
+    full_names = "," in text or QUANTITY_PATTERN.match(text.strip())
+    terms = [term.strip() for term in (text.split(",") if full_names else text.split())]
+    terms = [term for term in terms if term]
+    if not terms:
+        raise ValueError("Use: `$odds Fire Ball` or `$odds 2x Fire - 3 Mp, Ball - 2 Mp`")
+    if len(terms) > ODDS_TERMS_MAX:
+        raise ValueError(f"Ask about at most {ODDS_TERMS_MAX} cards at once!")
+    
+    texts = card_texts(deck["cards"])
+    names = [card_catalog.info(card_id)[0].casefold() for card_id in deck["cards"]]
+    groups, taken = [], set()
+    for term in terms:
+        try:
+            need, wanted = parse_card_quantity(term)
+        except ValueError as e:
+            raise ValueError(f"`{term}`: {e}")
+        if wanted.isdigit():
+            positions = [int(wanted) - 1] if 1 <= int(wanted) <= len(texts) else []
+        else:
+            folded = wanted.casefold()
+            positions = [pos for pos, name in enumerate(names) if name == folded or texts[pos].casefold() == folded]
+            positions = positions or [pos for pos, card in enumerate(texts) if folded in card.casefold()]
+        if not positions:
+            raise ValueError(f"No card matching `{wanted}` in the deck!")
+        if taken.intersection(positions):
+            raise ValueError(f"`{wanted}` matches a card already asked about!")
+        taken.update(positions)
+        label = texts[positions[0]] if len(positions) == 1 else f"{wanted} ({len(positions)} cards)"
+        copies = sum(deck["counts"][pos] for pos in positions)
+        if need > copies:
+            raise ValueError(f"Can't draw {need} of `{label}`, the deck only has {copies}!")
+        groups.append((label, positions, need))
+    return groups
+
+@bot.command()
+async def odds(ctx, *, text: str):
+    """Chance of drawing cards: $odds Fire Ball, $odds 2x Fire - 3 Mp, Ball - 2 Mp, $odds 1 5 @player"""
+    try:
+        mention, words = parse_mention_at_end(text.split())
+        
+        if mention:
+            if not is_admin(ctx):
+                await ctx.send("❌ Only admins can check other players' odds!")
+                return
+            
+            target = await resolve_member(ctx, mention)
+            if target is None:
+                await ctx.send("Invalid user mention!")
+                return
+            text = text[:text.rindex(mention)]
+        else:
+            target = ctx.author
+        
+        current = get_current_deck(target.id)
+        hand_size = current["hand_size"]
+        if deck_size(current) < hand_size:
+            await ctx.send(f"❌ {target.display_name} needs at least {hand_size} cards in their deck! (Has {deck_size(current)})")
+            return
+        
+        try:
+            groups = odds_groups(current, text)
+        except ValueError as e:
+            await ctx.send(str(e))
+            return
+        
+        sizes = [sum(current["counts"][pos] for pos in positions) for _, positions, _ in groups]
+        needs = [need for _, _, need in groups]
+        others = deck_size(current) - sum(sizes)
+        
+        # The odds only depend on the composition, so equal decks share results
+        key = (tuple(sizes), others, hand_size, tuple(needs))
+        result = odds_cache.get(key, None)
+        if result is None:
+            opening = exact_opening_odds(sizes, others, hand_size, needs)
+            trials = ODDS_TRIALS if np is not None else ODDS_FALLBACK_TRIALS
+            _, replaced = await asyncio.get_running_loop().run_in_executor(
+                odds_pool(), simulate_odds, sizes, others, hand_size, needs, trials, random.getrandbits(64)
+            )
+            result = (opening, replaced / trials, trials)
+            odds_cache.put(key, None, result)
+        opening, replaced, trials = result
+        
+        margin = 1.96 * math.sqrt(replaced * (1 - replaced) / trials)
+        wanted = ", ".join(f"`{label}` ({need}+ of {size})" for (label, _, need), size in zip(groups, sizes))
+        response = f"🎯 **{target.display_name}'s {current['name']}** - hand of {hand_size} from {deck_size(current)} cards\n"
+        response += f"Wanted: {wanted}\n"
+        response += f"• Opening hand: **{opening:.2%}** (exact)\n"
+        response += f"• After one `$x` of every other card: **{replaced:.2%}** ± {margin:.2%} ({trials:,} simulated hands)"
+        await ctx.send(response)
+    
+    except Exception as e:
+        print(f"Error in odds command: {e}")
+        traceback.print_exc()
+        await ctx.send(f"❌ Error in odds command.")
+
 # ===== ROLL =====
 
+# $r takes dice notation: terms such as 4d6kh3, 10d10>=7, 2d20adv or plain
+# numbers joined with + and -. Each expression is compiled once into DiceTerms
+# and kept by its text; pools of DICE_BULK dice or more are rolled in one call
+# (NumPy when installed) and summarized instead of listed die by die
+
+DICE_TERM_PATTERN = re.compile(r"([+-]?)(?:(\d*)d(\d+|%)(adv|dis|[kd][hl]\d*)?([<>]=?\d+)?|(\d+))")
+DICE_TESTS = {">=": operator.ge, ">": operator.gt, "<=": operator.le, "<": operator.lt}
+DICE_MAX_TERMS = 10
+DICE_MAX_DICE = 100000
+DICE_MAX_SIDES = 1000000
+DICE_SHOWN = 30
+DICE_BULK = 1000
+DICE_HISTOGRAM_SIDES = 12
+
+dice_cache = RenderCache(256)
+_dice_rng = np.random.default_rng() if np is not None else None
+
+def roll_pool(count, sides):
+    """Roll count dice at once: a NumPy array for big pools, else a list"""
+    if _dice_rng is not None and count >= DICE_BULK:
+        return _dice_rng.integers(1, sides + 1, size=count)
+    return random.choices(range(1, sides + 1), k=count)
+
+class DiceTerm:
+    """One signed term of a dice expression: NdS with optional keep and success count, or a constant"""
+    
+    __slots__ = ("sign", "count", "sides", "keep", "highest", "compare", "target")
+    
+    def __init__(self, sign, count, sides=0, keep=None, highest=True, compare=None, target=None):
+        self.sign = sign
+        self.count = count
+        self.sides = sides
+        self.keep = keep
+        self.highest = highest
+        self.compare = compare
+        self.target = target
+    
+    def roll(self):
+        """Roll the term: returns (signed value, text describing the roll)"""
+        if not self.sides:
+            return self.sign * self.count, str(self.count)
+        rolls = roll_pool(self.count, self.sides)
+        kept = rolls
+        if self.keep is not None:
+            ordered = sorted(rolls) if isinstance(rolls, list) else np.sort(rolls)
+            kept = ordered[len(ordered) - self.keep:] if self.highest else ordered[:self.keep]
+        if self.compare:
+            test = DICE_TESTS[self.compare]
+            value = int(test(kept, self.target).sum()) if not isinstance(kept, list) else sum(test(die, self.target) for die in kept)
+        else:
+            value = int(sum(kept)) if isinstance(kept, list) else int(kept.sum())
+        return self.sign * value, self.describe(rolls, value)
+    
+    def describe(self, rolls, value):
+        if self.count > DICE_SHOWN:
+            bulk = not isinstance(rolls, list)
+            text = f"{self.count}d{self.sides} (avg {(rolls.sum() if bulk else sum(rolls)) / self.count:.2f}"
+            if self.sides <= DICE_HISTOGRAM_SIDES:
+                faces = np.bincount(rolls, minlength=self.sides + 1) if bulk else Counter(rolls)
+                text += ", " + " ".join(f"{face}×{faces[face]}" for face in range(1, self.sides + 1))
+            text += ")"
+        else:
+            # Strike the dropped dice, in the order they were rolled
+            dropped = set()
+            if self.keep is not None:
+                by_value = sorted(range(self.count), key=rolls.__getitem__)
+                dropped = set(by_value[:self.count - self.keep] if self.highest else by_value[self.keep:])
+            text = "[" + ", ".join(f"~~{die}~~" if pos in dropped else str(die) for pos, die in enumerate(rolls)) + "]"
+        if self.compare:
+            text += f" {self.compare}{self.target}"
+        elif self.keep is not None and self.count > DICE_SHOWN:
+            text += f" kept {'highest' if self.highest else 'lowest'} {self.keep}: {value}"
+        return text
+
+def compile_dice(expression):
+    """Compile dice notation into DiceTerms (cached by its text); raises ValueError with the reason"""
+    terms = dice_cache.get(expression, None)
+    if terms is not None:
+        return terms
+    terms, pos, total_dice = [], 0, 0
+    while pos < len(expression):
+        match = DICE_TERM_PATTERN.match(expression, pos)
+        if not match or match.end() == pos or (terms and not match.group(1)):
+            raise ValueError(f"unexpected `{expression[pos:]}`")
+        pos = match.end()
+        sign = -1 if match.group(1) == "-" else 1
+        if match.group(6):
+            terms.append(DiceTerm(sign, int(match.group(6))))
+            continue
+        count = int(match.group(2) or 1)
+        sides = 100 if match.group(3) == "%" else int(match.group(3))
+        if not 1 <= sides <= DICE_MAX_SIDES:
+            raise ValueError(f"dice need between 1 and {DICE_MAX_SIDES} sides")
+        keep, highest = None, True
+        modifier = match.group(4) or ""
+        if modifier in ("adv", "dis"):
+            if count > 2:
+                raise ValueError("advantage and disadvantage roll 2 dice")
+            count, keep, highest = 2, 1, modifier == "adv"
+        elif modifier:
+            amount = int(modifier[2:] or 1)
+            if not 1 <= amount <= count:
+                raise ValueError(f"can't keep or drop {amount} of {count} dice")
+            # Dropping the highest N is keeping the lowest count - N, and so on
+            highest = modifier[1] == "h" if modifier[0] == "k" else modifier[1] == "l"
+            keep = amount if modifier[0] == "k" else count - amount
+            if keep == 0:
+                raise ValueError("that would drop every die")
+        compare = target = None
+        if match.group(5):
+            compare = match.group(5).rstrip("0123456789")
+            target = int(match.group(5)[len(compare):])
+        total_dice += count
+        if not count or total_dice > DICE_MAX_DICE:
+            raise ValueError(f"roll between 1 and {DICE_MAX_DICE} dice")
+        terms.append(DiceTerm(sign, count, sides, keep, highest, compare, target))
+    if not terms or len(terms) > DICE_MAX_TERMS:
+        raise ValueError(f"use 1 to {DICE_MAX_TERMS} terms")
+    dice_cache.put(expression, None, terms)
+    return terms
+
 @bot.command()
-async def r(ctx):
-    """Roll d20: $r"""
-    try:
-        roll = random.randint(1, 20)
-        if roll == 1:
-            response = f'🎲 Rolled **{roll}** - Critical fail!'
-        elif roll == 20:
-            response = f'🎲 Rolled **{roll}** - NATURAL 20! 🎉'
-        elif roll < 10:
-            response = f'🎲 Rolled **{roll}** - get fucked lmao!'
+async def r(ctx, *, expression: str = "d20"):
+    """Roll dice: $r (d20), $r 4d6kh3+2, $r 10d10>=7, $r 2d20adv, $r 1000d6"""
+    try:
+        expression = "".join(expression.split()).lower()
+        try:
+            terms = compile_dice(expression)
+        except ValueError as e:
+            await ctx.send(f"❌ Couldn't roll `{expression}`: {e}. Try `$r 4d6kh3+2`, `$r 10d10>=7` or `$r 2d20adv`")
+            return
+        
+        results = [term.roll() for term in terms]
+        total = sum(value for value, _ in results)
+        
+        # A lone d20 (with or without advantage) keeps its natural-roll flavor
+        term = terms[0]
+        if len(terms) == 1 and term.sides == 20 and term.count == (2 if term.keep else 1) and not term.compare:
+            if total == 1:
+                flavor = "Critical fail!"
+            elif total == 20:
+                flavor = "NATURAL 20! 🎉"
+            elif total < 10:
+                flavor = "get fucked lmao!"
+            else:
+                flavor = "not bad!"
+            response = f'🎲 Rolled **{total}** - {flavor}'
+            if term.keep:
+                response += f" {results[0][1]}"
         else:
-            response = f'🎲 Rolled **{roll}** - not bad!'
+            counting = any(term.compare for term in terms) and all(term.compare or not term.sides for term in terms)
+            unit = " success(es)" if counting else ""
+            details = "".join(f" {'-' if term.sign < 0 else '+'} {text}" for term, (_, text) in zip(terms, results))
+            details = details[3:] if terms[0].sign > 0 else details[1:]
+            response = f"🎲 `{expression}`: {details} = **{total}**{unit}"
+            if len(response) > MESSAGE_LIMIT:
+                response = f"🎲 `{expression}` = **{total}**{unit}"
         await ctx.send(response)
     except Exception as e:
         await ctx.send(f"❌ Error: {e}")
 
-# ===== HELP =====
+# ===== ADMIN =====
+
+@bot.command()
+async def cache(ctx):
+    """Show player cache statistics: $cache (admin)"""
+    try:
+        if not is_admin(ctx):
+            await ctx.send("❌ Only admins can view cache statistics!")
+            return
+        
+        lookups = player_cache.hits + player_cache.misses
+        hit_rate = 100 * player_cache.hits / lookups if lookups else 0
+        response = "**Player Cache:**\n"
+        response += f"• Resident: {len(player_cache)}/{player_cache.max_players} players\n"
+        response += f"• Size: ~{player_cache.total_bytes // 1024} KB / {player_cache.max_bytes // 1024} KB\n"
+        response += f"• Hits: {player_cache.hits} | Misses: {player_cache.misses} ({hit_rate:.1f}% hit rate)\n"
+        response += f"• Evictions: {player_cache.evictions}\n"
+        response += f"• Unsaved: {len(dirty_players)} dirty, {len(_unsaved_players)} awaiting write"
+        await ctx.send(response)
+    
+    except Exception as e:
+        print(f"Error in cache command: {e}")
+        await ctx.send(f"❌ Error in cache command.")
+
+@bot.command()
+async def locks(ctx):
+    """Show player lock wait statistics: $locks (admin)"""
+    try:
+        if not is_admin(ctx):
+            await ctx.send("❌ Only admins can view lock statistics!")
+            return
+        
+        acquisitions = player_locks.acquisitions
+        avg_wait = 1000 * player_locks.wait_total / acquisitions if acquisitions else 0
+        response = "**Player Locks:**\n"
+        response += f"• Stripes: {len(player_locks.locks)} ({sum(lock.locked() for lock in player_locks.locks)} held)\n"
+        response += f"• Acquisitions: {acquisitions} | Contended: {player_locks.contended}\n"
+        response += f"• Wait: {avg_wait:.2f} ms avg, {1000 * player_locks.wait_max:.2f} ms max"
+        await ctx.send(response)
+    
+    except Exception as e:
+        print(f"Error in locks command: {e}")
+        await ctx.send(f"❌ Error in locks command.")
+
+@bot.command()
+async def queue(ctx):
+    """Show outbound message queue statistics: $queue (admin)"""
+    try:
+        if not is_admin(ctx):
+            await ctx.send("❌ Only admins can view queue statistics!")
+            return
+        
+        delivered = outbound.enqueued - outbound.depth()
+        avg_delay = 1000 * outbound.delay_total / delivered if delivered else 0
+        response = "**Outbound Queue:**\n"
+        response += f"• Depth: {outbound.depth()} queued (max {outbound.depth_max}) across {len(outbound.channels)} channel(s)\n"
+        response += f"• Replies: {outbound.enqueued} queued, {outbound.sent} messages sent ({outbound.coalesced} coalesced)\n"
+        response += f"• Delay: {avg_delay:.1f} ms avg, {1000 * outbound.delay_max:.1f} ms max"
+        await ctx.send(response)
+    
+    except Exception as e:
+        print(f"Error in queue command: {e}")
+        await ctx.send(f"❌ Error in queue command.")
+
+@bot.command()
+async def members(ctx):
+    """Show member lookup statistics: $members (admin)"""
+    try:
+        if not is_admin(ctx):
+            await ctx.send("❌ Only admins can view member lookup statistics!")
+            return
+        
+        resolver = member_resolver
+        avg_time = 1000 * resolver.time_total / resolver.resolved if resolver.resolved else 0
+        response = "**Member Lookups:**\n"
+        response += f"• Resolved: {resolver.resolved} | Guild cache hits: {resolver.cache_hits} | Failed: {resolver.failures}\n"
+        response += f"• API fallbacks: {resolver.fetches} fetched, {resolver.fetch_hits} reused ({len(resolver.fetched)} remembered)\n"
+        response += f"• Latency: {avg_time:.2f} ms avg, {1000 * resolver.time_max:.2f} ms max"
+        await ctx.send(response)
+    
+    except Exception as e:
+        print(f"Error in members command: {e}")
+        await ctx.send(f"❌ Error in members command.")
+
+@bot.command()
+async def perf(ctx, top: int = 10):
+    """Show command latency, flush, event loop and gateway metrics: $perf [top N] (admin)"""
+    try:
+        if not is_admin(ctx):
+            await ctx.send("❌ Only admins can view performance metrics!")
+            return
+        
+        def ms(seconds):
+            return f"{1000 * seconds:.1f} ms"
+        
+        uptime = int(time.monotonic() - metrics.started)
+        response = f"**Performance** (up {uptime // 3600}h {uptime // 60 % 60}m)\n"
+        
+        busiest = sorted(metrics.commands.items(), key=lambda item: -item[1].count)[:max(1, top)]
+        response += "**Commands** (until replies are queued; p50/p95 are bucket upper bounds):\n"
+        if not busiest:
+            response += "• None yet\n"
+        for name, histogram in busiest:
+            response += (
+                f"• `{name}`: {histogram.count} call(s), p50 {ms(histogram.quantile(0.5))}, "
+                f"p95 {ms(histogram.quantile(0.95))}, max {ms(histogram.max)}"
+            )
+            failures = metrics.command_failures.get(name)
+            response += f", {failures} failed\n" if failures else "\n"
+        if metrics.errors:
+            response += "• Errors: " + ", ".join(f"{error_type} {seen}" for error_type, seen in metrics.errors.most_common(5)) + "\n"
+        
+        flushes = metrics.flushes
+        response += f"**Flushes:** {flushes.count} ({metrics.flush_players} player write(s), {metrics.flush_failures} failed)\n"
+        if flushes.count:
+            response += (
+                f"• Time: {ms(flushes.mean())} avg, p95 {ms(flushes.quantile(0.95))}, max {ms(flushes.max)} "
+                f"({ms(metrics.flush_snapshot.mean())} avg on the event loop)\n"
+                f"• Written: {metrics.flush_bytes // 1024} KB, {metrics.flush_bytes // flushes.count // 1024} KB avg\n"
+            )
+        checkpoints = metrics.checkpoints
+        if checkpoints.count:
+            response += f"• Session checkpoints: {checkpoints.count}, {ms(checkpoints.mean())} avg, {metrics.checkpoint_bytes // 1024} KB written\n"
+        
+        replies = metrics.replies
+        if replies.count:
+            response += f"**Reply delivery:** {replies.count} sent, p50 {ms(replies.quantile(0.5))}, p95 {ms(replies.quantile(0.95))}, max {ms(replies.max)}\n"
+        lag = metrics.loop_lag
+        response += f"**Event loop lag:** {ms(metrics.loop_lag_last)} now, p95 {ms(lag.quantile(0.95))}, max {ms(lag.max)}\n"
+        latencies = gateway_latencies()
+        if not latencies:
+            response += "**Gateway:** not connected\n"
+        elif len(latencies) == 1:
+            response += f"**Gateway:** {ms(latencies[0][1])} heartbeat\n"
+        else:
+            worst = max(latencies, key=lambda item: item[1])
+            average = sum(latency for _, latency in latencies) / len(latencies)
+            response += f"**Gateway:** {len(latencies)} shards, {ms(average)} avg, shard {worst[0]} slowest at {ms(worst[1])}\n"
+        
+        lookups = player_cache.hits + player_cache.misses
+        renders = render_cache.hits + render_cache.misses
+        response += (
+            f"**Caches:** players {100 * player_cache.hits / lookups if lookups else 0:.0f}% hits, "
+            f"renders {100 * render_cache.hits / renders if renders else 0:.0f}% hits | "
+            f"**Locks:** {player_locks.contended} contended | **Queue:** {outbound.depth()} queued"
+        )
+        await ctx.send(response)
+    
+    except Exception as e:
+        print(f"Error in perf command: {e}")
+        await ctx.send(f"❌ Error in perf command.")
 
 @bot.command()
-async def helpme(ctx):
-    """Show all commands"""
-    help_text = f"""
-**🎴 MYTHOS BOT - COMPLETE COMMANDS 🎴**
+async def find(ctx, *, text: str):
+    """Find which players' decks hold cards matching some text: $find fire (admin)"""
+    try:
+        if not is_admin(ctx):
+            await ctx.send("❌ Only admins can search other players' decks!")
+            return
+        
+        matches = card_index.matching_cards(text)
+        base_matches = [card_id for card_id in card_ids(BASE_DECK) if card_id in matches]
+        
+        # Group this server's holders by player: player key -> deck num -> matching card ids
+        guild_id = current_guild.get()
+        holdings = {}
+        for card_id in matches:
+            for user_id, deck_num in card_index.holders.get(card_id, ()):
+                if card_index.in_guild(user_id, guild_id):
+                    holdings.setdefault(user_id, {}).setdefault(deck_num, []).append(card_id)
+        base_count = sum(card_index.in_guild(user_id, guild_id) for user_id in card_index.base_players) if base_matches else 0
+        
+        if not holdings and not base_count:
+            if card_index.ready:
+                await ctx.send(f"🔎 No decks hold cards matching `{text}`")
+            else:
+                await ctx.send(f"🔎 No decks found so far with cards matching `{text}`\n⏳ Still indexing, {card_index.indexed_players} player(s) so far")
+            return
+        
+        def player_name(user_id):
+            member = ctx.guild.get_member(key_user_id(user_id)) if ctx.guild else None
+            return member.display_name if member else f"User {key_user_id(user_id)}"
+        
+        lines = []
+        for player_name_text, user_id in sorted((player_name(user_id), user_id) for user_id in holdings):
+            decks_text = "; ".join(
+                f"Deck {deck_num}: " + ", ".join(f"`{card_catalog.texts[card_id]}`" for card_id in sorted(found))
+                for deck_num, found in sorted(holdings[user_id].items())
+            )
+            lines.append(f"**{player_name_text}** - {decks_text}")
+        if base_count:
+            base_list = ", ".join(f"`{card_catalog.texts[card_id]}`" for card_id in base_matches)
+            lines.append(f"🎴 Plus {base_count} player(s) still on the base Deck 1 ({base_list})")
+        
+        deck_count = sum(len(found) for found in holdings.values())
+        held = {card_id for found in holdings.values() for ids in found.values() for card_id in ids}
+        held.update(base_matches if base_count else ())
+        header = f"🔎 **{text}**: {len(held)} matching card(s) in {deck_count} deck(s) across {len(holdings)} player(s)\n"
+        if not card_index.ready:
+            header += f"⏳ Still indexing, {card_index.indexed_players} player(s) so far\n"
+        
+        pages = paginate(lines, header)
+        if len(pages) > 1:
+            await send_paged(ctx, render_text_page(pages))
+        else:
+            await ctx.send(pages[0])
+    
+    except Exception as e:
+        print(f"Error in find command: {e}")
+        await ctx.send(f"❌ Error in find command.")
+
+# ===== SLASH COMMANDS =====
+
+# Card names for autocomplete are matched by prefix against sorted
+# (casefolded text, value) arrays with bisect, so a lookup costs
+# O(log n + results) however large the deck or catalog gets
+
+AUTOCOMPLETE_LIMIT = 25
+
+def prefix_search(keys, prefix, limit=AUTOCOMPLETE_LIMIT):
+    """Values of the sorted (key, value) pairs whose key starts with prefix"""
+    prefix = prefix.casefold()
+    results = []
+    i = bisect_left(keys, (prefix,))
+    while i < len(keys) and len(results) < limit and keys[i][0].startswith(prefix):
+        results.append(keys[i][1])
+        i += 1
+    return results
+
+class CardNameIndex:
+    """Prefix index over every card text in the catalog, extended as the catalog grows"""
+    
+    def __init__(self):
+        self.keys = []  # sorted (casefolded text, card id)
+        self.indexed = 0
+    
+    def search(self, prefix, limit=AUTOCOMPLETE_LIMIT):
+        texts = card_catalog.texts
+        if len(texts) < self.indexed:
+            # Catalog was reloaded
+            self.keys, self.indexed = [], 0
+        new_keys = [(texts[card_id].casefold(), card_id) for card_id in range(self.indexed, len(texts))]
+        if len(new_keys) > 64:
+            self.keys = sorted(self.keys + new_keys)
+        else:
+            for key in new_keys:
+                insort(self.keys, key)
+        self.indexed = len(texts)
+        return prefix_search(self.keys, prefix, limit)
+
+card_name_index = CardNameIndex()
 
+def deck_name_index(user_id):
+    """Sorted (casefolded text, entry position) pairs for a player's current deck, cached per deck version"""
+    deck = get_current_deck(user_id)
+    deck_num = get_player(user_id)["current_deck"]
+    return cached_render(user_id, deck_num, "name index", lambda: sorted(
+        (card_catalog.texts[card_id].casefold(), pos) for pos, card_id in enumerate(deck["cards"])
+    ))
+
+def suggestion_target(interaction, player):
+    """Whose deck card suggestions come from: another player's only for admins, like the prefix commands"""
+    if player is not None and isinstance(interaction.user, discord.Member) and interaction.user.guild_permissions.administrator:
+        return player.id
+    return interaction.user.id
+
+def suggestion_deck(user_id):
+    """(current deck, name index) for suggestions; players without a record see the base deck and none is created"""
+    if existing_player(user_id) is None:
+        deck = DECK_TEMPLATES["1"]
+        return deck, sorted((card_catalog.texts[card_id].casefold(), pos) for pos, card_id in enumerate(deck["cards"]))
+    return get_current_deck(user_id), deck_name_index(user_id)
+
+async def run_slash(interaction, command, *args, players=(), **kwargs):
+    """Run a prefix command's body for a slash command, under the same player locks"""
+    ctx = await MythosContext.from_interaction(interaction)
+    started = time.perf_counter()
+    failed = True
+    try:
+        async with player_locks.hold(interaction.user.id, *(player.id for player in players if player is not None)):
+            await command.callback(ctx, *args, **kwargs)
+        failed = False
+    finally:
+        name = interaction.command.qualified_name if interaction.command else command.qualified_name
+        metrics.observe_command(f"/{name}", time.perf_counter() - started, failed)
+
+def slash_args(text, player):
+    """Prefix-style arguments for a slash option, with the player mention last like $x 1 3 @player"""
+    args = text.split() if text else []
+    if player is not None:
+        args.append(player.mention)
+    return args
+
+@bot.tree.command(name="draw", description="Draw a hand")
+@app_commands.describe(player="Draw for another player (admin)")
+async def slash_draw(interaction: discord.Interaction, player: Optional[discord.Member] = None):
+    await run_slash(interaction, draw, player, players=(player,))
+
+@bot.tree.command(name="hand", description="Show your current hand")
+@app_commands.describe(player="Show another player's hand (admin)")
+async def slash_hand(interaction: discord.Interaction, player: Optional[discord.Member] = None):
+    await run_slash(interaction, hand, player, players=(player,))
+
+@bot.tree.command(name="x", description="Replace cards in your hand")
+@app_commands.describe(cards="Hand positions, e.g. 1 3 5", player="Replace another player's cards (admin)")
+async def slash_x(interaction: discord.Interaction, cards: str, player: Optional[discord.Member] = None):
+    await run_slash(interaction, x, *slash_args(cards, player), players=(player,))
+
+@bot.tree.command(name="mp", description="Change MP: +2, -3 or max")
+@app_commands.describe(operation="+2, -3 or max", player="Change another player's MP (admin)")
+async def slash_mp(interaction: discord.Interaction, operation: str, player: Optional[discord.Member] = None):
+    await run_slash(interaction, mp, operation, player, players=(player,))
+
+@bot.tree.command(name="shuffle", description="Shuffle your discard pile back into the draw pile")
+@app_commands.describe(player="Shuffle another player's discards (admin)")
+async def slash_shuffle(interaction: discord.Interaction, player: Optional[discord.Member] = None):
+    await run_slash(interaction, shuffle, player, players=(player,))
+
+@bot.tree.command(name="pile", description="Show draw pile, hand and discard counts")
+@app_commands.describe(player="Show another player's piles (admin)")
+async def slash_pile(interaction: discord.Interaction, player: Optional[discord.Member] = None):
+    await run_slash(interaction, pile, player, players=(player,))
+
+@bot.tree.command(name="discard", description="Show your discard pile or discard cards from hand")
+@app_commands.describe(cards="Hand positions to discard, e.g. 2 4", player="Another player's discard pile (admin)")
+async def slash_discard(interaction: discord.Interaction, cards: Optional[str] = None, player: Optional[discord.Member] = None):
+    await run_slash(interaction, discard, *slash_args(cards, player), players=(player,))
+
+@bot.tree.command(name="cards", description="Show your current deck")
+@app_commands.describe(player="Show another player's deck (admin)")
+async def slash_cards(interaction: discord.Interaction, player: Optional[discord.Member] = None):
+    await run_slash(interaction, cards, player, players=(player,))
+
+@bot.tree.command(name="decks", description="Show all your decks with a preview")
+@app_commands.describe(player="Show another player's decks (admin)")
+async def slash_decks(interaction: discord.Interaction, player: Optional[discord.Member] = None):
+    await run_slash(interaction, decks, player, players=(player,))
+
+@bot.tree.command(name="deck", description="Switch to another deck or reset the current one")
+@app_commands.describe(action="Deck to switch to, or reset", player="Another player's deck (admin)")
+@app_commands.choices(action=[app_commands.Choice(name=f"Deck {slot}", value=slot) for slot in DECK_SLOTS] + [app_commands.Choice(name="Reset current deck", value="reset")])
+async def slash_deck(interaction: discord.Interaction, action: str, player: Optional[discord.Member] = None):
+    await run_slash(interaction, deck, action, player, players=(player,))
+
+@bot.tree.command(name="name", description="Name your current deck")
+@app_commands.describe(text="New deck name", player="Name another player's deck (admin)")
+async def slash_name(interaction: discord.Interaction, text: str, player: Optional[discord.Member] = None):
+    await run_slash(interaction, name, text=" ".join(slash_args(text, player)), players=(player,))
+
+@bot.tree.command(name="clear", description="Clear your current deck")
+@app_commands.describe(player="Clear another player's deck (admin)")
+async def slash_clear(interaction: discord.Interaction, player: Optional[discord.Member] = None):
+    await run_slash(interaction, clear, player, players=(player,))
+
+@bot.tree.command(name="default", description="Reset your current deck to the base cards")
+@app_commands.describe(player="Reset another player's deck (admin)")
+async def slash_default(interaction: discord.Interaction, player: Optional[discord.Member] = None):
+    await run_slash(interaction, default, player, players=(player,))
+
+@bot.tree.command(name="add", description="Add a card to your deck")
+@app_commands.describe(card="Card text, e.g. Fire - 3 Mp", copies="Number of copies", player="Add to another player's deck (admin)")
+async def slash_add(interaction: discord.Interaction, card: str, copies: app_commands.Range[int, 1, MAX_CARD_QUANTITY] = 1, player: Optional[discord.Member] = None):
+    text = f"{copies}x {card}" if copies > 1 else card
+    await run_slash(interaction, add, text=" ".join(slash_args(text, player)), players=(player,))
+
+@slash_add.autocomplete("card")
+async def add_card_autocomplete(interaction: discord.Interaction, current: str):
+    """Cards already in the deck first, then anything else in the catalog"""
+    deck, name_index = suggestion_deck(suggestion_target(interaction, getattr(interaction.namespace, "player", None)))
+    card_ids_found = [deck["cards"][pos] for pos in prefix_search(name_index, current)]
+    for card_id in card_name_index.search(current):
+        if len(card_ids_found) >= AUTOCOMPLETE_LIMIT:
+            break
+        if card_id not in card_ids_found:
+            card_ids_found.append(card_id)
+    texts = [card_catalog.texts[card_id][:100] for card_id in card_ids_found]
+    return [app_commands.Choice(name=text, value=text) for text in texts]
+
+@bot.tree.command(name="remove", description="Remove a card from your deck")
+@app_commands.describe(card="Card to remove (start typing its name) or its number in $cards", player="Remove from another player's deck (admin)")
+async def slash_remove(interaction: discord.Interaction, card: str, player: Optional[discord.Member] = None):
+    if not card.strip().isdigit():
+        # Typed text instead of picking a suggestion: use the first entry it names
+        _, name_index = suggestion_deck(suggestion_target(interaction, player))
+        matches = prefix_search(name_index, card.strip(), 1)
+        card = str(matches[0] + 1) if matches else card
+    await run_slash(interaction, remove, *slash_args(card, player), players=(player,))
+
+@slash_remove.autocomplete("card")
+async def remove_card_autocomplete(interaction: discord.Interaction, current: str):
+    deck, name_index = suggestion_deck(suggestion_target(interaction, getattr(interaction.namespace, "player", None)))
+    if current:
+        positions = prefix_search(name_index, current)
+    else:
+        positions = range(min(len(deck["cards"]), AUTOCOMPLETE_LIMIT))
+    return [
+        app_commands.Choice(name=f"{pos + 1}. {format_entry(deck['cards'][pos], deck['counts'][pos])}"[:100], value=str(pos + 1))
+        for pos in positions
+    ]
+
+# ===== HELP =====
+
+HELP_OVERVIEW = """
+**🎴 MYTHOS BOT - COMMANDS 🎴**
+
+Use `$helpme <topic>` for the commands in a topic:
+`$helpme deck` - Deck management and switching
+`$helpme play` - Drawing, replacing and discarding
+`$helpme mp` - MP, cost curve and draw odds
+`$helpme settings` - Settings and stats
+`$helpme other` - Dice rolls and admin tools
+
+**QUICK START:**
+`$draw` - Draw a hand (with replace and MP buttons)
+`$x 1 3 5` - Replace cards in hand
+`$mp -3` - Spend MP
+`$cards` - Show your current deck
+`$add [card]` - Add card(s) to your deck (one per line)
+
+**SLASH COMMANDS:**
+`/draw` `/hand` `/x` `/mp` `/deck` `/decks` `/cards` `/add` `/remove` and more - same as the `$` versions, with card name suggestions for `/add` and `/remove`
+
+**DEFAULTS:**
+• 5 decks per player (Deck 1 has base cards, others empty)
+• Hand size: 6 | Max MP: 10 (can go negative)
+• Base deck: {base_size} cards
+• Data auto-saves to file
+"""
+
+# $helpme <topic>; each entry is sent as one message, so keep them under Discord's 2000 character limit
+HELP_TOPICS = {
+    "deck": """
 **DECK MANAGEMENT:**
 `$cards` - Show your current deck
 `$cards @player` - Show another player's deck (admin)
 `$add [card]` - Add card(s) to your deck (one per line)
+`$add 4x [card]` - Add several copies of a card
 `$add [card] @player` - Add to player's deck (admin)
-`$remove 1 3 5` - Remove multiple cards
+`$remove 1 3 5` - Remove multiple cards (repeat a number to remove more copies)
 `$remove 1 3 @player` - Remove from player's deck (admin)
 `$clear` - Clear your current deck
 `$clear @player` - Clear player's deck (admin)
 `$default` - Reset to base 12 cards
 `$default @player` - Reset player's deck (admin)
+`$import` - Add cards from an attached .txt, .csv or .json file (`$import replace` to overwrite)
+`$export` - Download your deck as a file (`$export csv`, `$export json`)
 
 **DECK SWITCHING:**
 `$deck 2` - Switch to deck 2
@@ -957,59 +4320,99 @@ async def helpme(ctx):
 `$name My Deck` - Name your current deck
 `$name Arena @player` - Name player's deck (admin)
 
+**BULK ADD EXAMPLE:**
+$add
+Fire - 3 Mp
+2x Wind - 3 Mp
+Water - 3 Mp
+Earth - 3 Mp
+""",
+    "play": """
 **GAME PLAY:**
-`$draw` - Draw a hand
+`$draw` - Draw a hand (with replace and MP buttons)
 `$draw @player` - Draw for player (admin)
+`$draw @Party` - Draw for a whole role or several players (admin)
 `$hand` - Show your current hand
 `$hand @player` - Show player's hand
 `$x 1 3 5` - Replace cards in hand
 `$x 1 3 5 @player` - Replace player's cards (admin)
-
+`$discard` - Show your discard pile
+`$discard 2 4` - Discard cards from your hand
+`$shuffle` - Shuffle your discard pile back into the draw pile
+`$pile` - Show draw pile, hand and discard counts
+""",
+    "mp": """
 **MP SYSTEM:**
 `$mp +2` - Add MP (can go negative)
 `$mp -3` - Subtract MP (can go negative)
 `$mp max` - Reset to max MP
 `$mp max @player` - Reset player's MP (admin)
-
+`$mp max @Party` - Reset MP for a whole role or several players (admin)
+`$curve` - MP curve of your deck
+`$odds Fire Ball` - Chance of drawing cards in your opening hand and after `$x`
+`$odds 2x Fire - 3 Mp, Ball - 2 Mp` - Several copies, full card names
+`$hand` also totals the hand's MP cost against your current MP
+""",
+    "settings": """
 **SETTINGS:**
 `$settings` - View current settings
 `$settings hand 8` - Set hand size
 `$settings hand 8 @player` - Set player's hand size (admin)
 `$settings mp 15` - Set max MP
 `$settings mp 15 @player` - Set player's max MP (admin)
+`$settings hand 8 @Party` - Change a setting for a whole role (admin)
+`$settings page 25` - Cards per page in `$cards`
+`$settings reshuffle off` - Don't reshuffle discards when the pile runs out
+`$settings costs on` - Flag cards you can't afford in drawn hands
 
 **STATS:**
 `$stats` - View stats
 `$stats My arena stats` - Set your stats
 `$stats New stats @player` - Set player's stats (admin)
-
-**OTHER:**
+""",
+    "other": """
+**DICE:**
 `$r` - Roll d20
-`$helpme` - This message
+`$r 4d6kh3+2` - Roll dice: keep/drop (`kh3`, `dl1`), `2d20adv`/`dis`, successes (`10d10>=7`)
 
-**DEFAULTS:**
-• 5 decks per player (Deck 1 has base cards, others empty)
-• Hand size: 6 | Max MP: 10 (can go negative)
-• Base deck: {len(BASE_DECK)} cards
-• Data auto-saves to file
+**ADMIN:**
+`$find fire` - Find who holds cards matching some text
+`$cache` - Player cache statistics
+`$locks` - Player lock wait statistics
+`$queue` - Outbound message queue statistics
+`$members` - Member lookup statistics
+`$perf` - Command latency, flush and gateway metrics
 
-**BULK ADD EXAMPLE:**
-$add
-Fire - 3 Mp
-Wind - 3 Mp
-Water - 3 Mp
-Earth - 3 Mp
-"""
+`$helpme` - List the help topics
+""",
+}
+
+@bot.command()
+async def helpme(ctx, topic: Optional[str] = None):
+    """Show commands: $helpme or $helpme <topic>"""
+    if topic is None:
+        await ctx.send(HELP_OVERVIEW.format(base_size=len(BASE_DECK)))
+        return
+    
+    help_text = HELP_TOPICS.get(topic.lower())
+    if help_text is None:
+        await ctx.send(f"❌ Unknown help topic `{topic}`. Topics: {', '.join(f'`{name}`' for name in HELP_TOPICS)}")
+        return
     await ctx.send(help_text)
 
 # ===== RUN BOT =====
 
 TOKEN = os.environ.get("DISCORD_TOKEN")
-if not TOKEN:
-    print("❌ ERROR: Set DISCORD_TOKEN environment variable!")
-    print("In Railway: Variables → Add DISCORD_TOKEN")
-else:
-    try:
-        bot.run(TOKEN)
-    except Exception as e:
-        print(f"❌ Failed to start bot: {e}")
+# $odds worker processes import this module too; only the real entry point starts anything
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        # python main.py migrate [player_data.json] [player_data.db]
+        migrate_json_to_sqlite(*sys.argv[2:4])
+    elif not TOKEN:
+        print("❌ ERROR: Set DISCORD_TOKEN environment variable!")
+        print("In Railway: Variables → Add DISCORD_TOKEN")
+    else:
+        try:
+            bot.run(TOKEN)
+        except Exception as e:
+            print(f"❌ Failed to start bot: {e}")